@@ -0,0 +1,112 @@
+"""Compare the single-pass mrkdwn converter with the old chain of re.sub calls.
+
+Run from the slack-messaging directory:
+
+    PYTHONPATH=src python benchmarks/bench_mrkdwn.py
+"""
+
+import argparse
+import re
+import timeit
+
+from langgraph_slack.mrkdwn import to_mrkdwn
+
+SECTION = """## Step {n}: configure the **scheduler**
+
+To change the posting schedule, edit `schedule.ts` and see the [docs](https://example.com/docs/{n}).
+This is *important*: the cron runs in **UTC**, not local time.
+
+- Open the file
+- Change the `cron` expression
+  * keep the **minute** field at `0`
+
+```typescript
+export const schedule = {{
+  cron: "0 9 * * 1-5", // **weekdays** at 9am
+  channels: ["#marketing", "#social"],
+  retry: {{ attempts: 3, backoffMs: 5_000 }},
+}};
+```
+
+"""
+
+
+# Inputs and the mrkdwn to_mrkdwn must turn them into, checked before timing
+# so that the speedup is measured for a converter that gets them right. The
+# old chain gets several of them wrong (code is rewritten, for one).
+CASES = [
+    ("plain text", "plain text"),
+    ("**bold** and *italic*", "*bold* and _italic_"),
+    ("***both***", "*_both_*"),
+    ("a ***both*** b", "a *_both_* b"),
+    ("see [the docs](https://example.com)", "see <https://example.com|the docs>"),
+    ("**[bold link](https://example.com)**", "*<https://example.com|bold link>*"),
+    ("- one\n* two\n  - nested", "• one\n• two\n  • nested"),
+    ("run `a*b*c` now", "run `a*b*c` now"),
+    ("```py\nx = a*b*c\n**k** [a](b)\n```", "```\nx = a*b*c\n**k** [a](b)\n```"),
+    (
+        "1. step\n   ```py\n   x = a*b*c*d\n   **k** [a](b)\n   ```\nafter **x**",
+        "1. step\n   ```\n   x = a*b*c*d\n   **k** [a](b)\n   ```\nafter *x*",
+    ),
+    (
+        "- item\n  ```\n  * not a bullet\n  ```",
+        "• item\n  ```\n  * not a bullet\n  ```",
+    ),
+    ("```\nunclosed *code*", "```\nunclosed *code*"),
+]
+
+
+def check_cases() -> bool:
+    ok = True
+    for text, expected in CASES:
+        if (result := to_mrkdwn(text)) != expected:
+            print(f"MISMATCH {text!r}: got {result!r}, expected {expected!r}")
+            ok = False
+    return ok
+
+
+def clean_markdown_regex_chain(text: str) -> str:
+    """The converter used before to_mrkdwn, kept here as the baseline."""
+    text = re.sub(r"^```[^\n]*\n", "```\n", text, flags=re.MULTILINE)
+    text = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r"<\2|\1>", text)
+    text = re.sub(r"\*\*([^*]+)\*\*", r"*\1*", text)
+    text = re.sub(r"(?<!\*)\*([^*]+)\*(?!\*)", r"_\1_", text)
+    text = re.sub(r"_([^_]+)_", r"_\1_", text)
+    text = re.sub(r"^\s*[-*]\s", "• ", text, flags=re.MULTILINE)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2, 8, 32])
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    if not check_cases():
+        raise SystemExit(1)
+    print(f"to_mrkdwn converts all {len(CASES)} cases correctly")
+
+    print(f"{'size':>8} {'regex chain':>14} {'to_mrkdwn':>14} {'speedup':>8}")
+    for kb in args.sizes:
+        text = ""
+        n = 0
+        while len(text) < kb * 1024:
+            n += 1
+            text += SECTION.format(n=n)
+        results = {}
+        for name, func in (
+            ("regex chain", clean_markdown_regex_chain),
+            ("to_mrkdwn", to_mrkdwn),
+        ):
+            timer = timeit.Timer(lambda: func(text))
+            number, _ = timer.autorange()
+            best = min(timer.repeat(repeat=args.repeat, number=number)) / number
+            results[name] = best
+        print(
+            f"{kb:>6}KB {results['regex chain'] * 1e6:>12.1f}us "
+            f"{results['to_mrkdwn'] * 1e6:>12.1f}us "
+            f"{results['regex chain'] / results['to_mrkdwn']:>7.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,275 @@
+"""Local stand-ins for the Slack Web API and a LangGraph deployment.
+
+Used by loadtest.py; both run as aiohttp apps in the driver's event loop so the
+driver can see what the bridge posted without going over the network again.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import re
+import time
+import uuid
+from collections import Counter, defaultdict
+
+import aiohttp
+from aiohttp import web
+
+BOT_USER_ID = "UBOT"
+TEAM_ID = "T0LOADTEST"
+QUESTION_PREFIX = "question number "
+QUESTION = re.compile(QUESTION_PREFIX + r"(\d+\.\d+)")
+
+
+async def _params(request: web.Request) -> dict:
+    """Slack API arguments, sent as a query string, a form or JSON."""
+    params = dict(request.query)
+    if request.can_read_body:
+        if request.content_type == "application/json":
+            params.update(await request.json())
+        else:
+            params.update(await request.post())
+    return params
+
+
+class FakeSlack:
+    """Serves the Slack Web API methods the bridge calls.
+
+    Each call takes `latency` seconds, and a `rate_limit_ratio` share of them
+    gets a 429 with a Retry-After of `retry_after` seconds. Posted replies are
+    passed to `on_reply(channel, thread_ts, text)`. apps.connections.open hands
+    out a Socket Mode websocket at /socket, through which send_envelope()
+    delivers events.
+    """
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        rate_limit_ratio: float = 0.0,
+        retry_after: int = 1,
+        on_reply=None,
+    ):
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.on_reply = on_reply
+        # Messages by (channel, thread_ts), oldest first.
+        self.threads: dict[tuple[str, str], list[dict]] = defaultdict(list)
+        self._message_threads: dict[str, str] = {}
+        self.calls: Counter[str] = Counter()
+        self.rate_limited: Counter[str] = Counter()
+        self._ts = itertools.count()
+        self.sockets: list[web.WebSocketResponse] = []
+        self.socket_url = ""
+        self._acks: dict[str, asyncio.Future] = {}
+
+    def next_ts(self) -> str:
+        return f"{time.time():.0f}.{next(self._ts):06d}"
+
+    def add_message(self, channel: str, message: dict) -> None:
+        thread_ts = message.get("thread_ts") or message["ts"]
+        self.threads[(channel, thread_ts)].append(message)
+        self._message_threads[message["ts"]] = thread_ts
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/api/{method}", self._dispatch)
+        app.router.add_get("/socket", self._socket)
+        return app
+
+    async def _dispatch(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if method != "auth.test" and random.random() < self.rate_limit_ratio:
+            self.rate_limited[method] += 1
+            return web.json_response(
+                {"ok": False, "error": "ratelimited"},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+        if method == "apps.connections.open":
+            self.socket_url = f"ws://{request.host}/socket"
+        handler = getattr(self, "_" + method.replace(".", "_"), None)
+        if handler is None:
+            return web.json_response({"ok": False, "error": "unknown_method"})
+        return web.json_response({"ok": True, **handler(await _params(request))})
+
+    async def _socket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        await ws.send_json({"type": "hello", "num_connections": 1})
+        self.sockets.append(ws)
+        try:
+            async for message in ws:
+                if message.type == aiohttp.WSMsgType.TEXT:
+                    ack = self._acks.pop(json.loads(message.data)["envelope_id"], None)
+                    if ack and not ack.done():
+                        ack.set_result(None)
+        finally:
+            self.sockets.remove(ws)
+        return ws
+
+    async def send_envelope(self, payload: dict) -> None:
+        """Deliver an Events API payload over Socket Mode; wait for the ack."""
+        envelope_id = str(uuid.uuid4())
+        ack = self._acks[envelope_id] = asyncio.get_running_loop().create_future()
+        await random.choice(self.sockets).send_json(
+            {
+                "envelope_id": envelope_id,
+                "type": "events_api",
+                "accepts_response_payload": False,
+                "retry_attempt": 0,
+                "retry_reason": "",
+                "payload": payload,
+            }
+        )
+        await ack
+
+    def _apps_connections_open(self, params: dict) -> dict:
+        return {"url": self.socket_url}
+
+    def _auth_test(self, params: dict) -> dict:
+        return {
+            "user_id": BOT_USER_ID,
+            "bot_id": "B" + BOT_USER_ID,
+            "team_id": TEAM_ID,
+            "url": "https://loadtest.slack.com/",
+        }
+
+    def _conversations_replies(self, params: dict) -> dict:
+        messages = self.threads.get((params["channel"], params["ts"]), [])
+        if oldest := params.get("oldest"):
+            messages = [msg for msg in messages if float(msg["ts"]) >= float(oldest)]
+        return {"messages": messages, "has_more": False}
+
+    def _users_info(self, params: dict) -> dict:
+        user = params["user"]
+        return {"user": {"id": user, "profile": {"display_name": f"user-{user}"}}}
+
+    def _users_list(self, params: dict) -> dict:
+        return {"members": [], "response_metadata": {"next_cursor": ""}}
+
+    def _chat_postMessage(self, params: dict) -> dict:
+        message = {
+            "ts": self.next_ts(),
+            "user": BOT_USER_ID,
+            "bot_id": BOT_USER_ID,
+            "text": params.get("text", ""),
+            "thread_ts": params.get("thread_ts"),
+        }
+        self.add_message(params["channel"], message)
+        if self.on_reply:
+            self.on_reply(params["channel"], params.get("thread_ts"), message["text"])
+        return {"channel": params["channel"], "ts": message["ts"], "message": message}
+
+    def _chat_update(self, params: dict) -> dict:
+        if self.on_reply:
+            thread_ts = self._message_threads.get(params["ts"])
+            self.on_reply(params["channel"], thread_ts, params.get("text", ""))
+        return {"channel": params["channel"], "ts": params["ts"]}
+
+    def _chat_delete(self, params: dict) -> dict:
+        return {"channel": params["channel"], "ts": params["ts"]}
+
+    def _chat_postEphemeral(self, params: dict) -> dict:
+        return {"message_ts": self.next_ts()}
+
+
+class FakeLangGraph:
+    """Accepts runs and answers them after `run_latency` seconds.
+
+    runs.create calls the run's webhook with the final state, like a LangGraph
+    deployment does; runs.stream streams the answer in `chunks` parts.
+    """
+
+    def __init__(self, run_latency: float = 0.5, chunks: int = 5):
+        self.run_latency = run_latency
+        self.chunks = chunks
+        self.runs = 0
+        self.webhook_errors = 0
+        self._session: aiohttp.ClientSession | None = None
+        self._callbacks: set[asyncio.Task] = set()
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/threads/{thread_id}/runs", self._create)
+        app.router.add_post("/threads/{thread_id}/runs/stream", self._stream)
+        app.on_cleanup.append(self._close)
+        return app
+
+    def _run(self, thread_id: str, body: dict) -> dict:
+        self.runs += 1
+        return {
+            "run_id": str(uuid.uuid4()),
+            "thread_id": thread_id,
+            "assistant_id": body.get("assistant_id"),
+            "status": "pending",
+            "metadata": body.get("metadata") or {},
+        }
+
+    @staticmethod
+    def _answer(body: dict) -> str:
+        # Name the newest question, i.e. the last one in the run's input, so
+        # the driver knows which mention was answered.
+        content = body["input"]["messages"][-1]["content"]
+        questions = QUESTION.findall(content) or ["unknown"]
+        return f"**Answer** to {QUESTION_PREFIX}{questions[-1]}."
+
+    async def _create(self, request: web.Request) -> web.Response:
+        body = await request.json()
+        run = self._run(request.match_info["thread_id"], body)
+        if webhook := body.get("webhook"):
+            task = asyncio.ensure_future(self._call_webhook(webhook, run, body))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
+        return web.json_response(run)
+
+    async def _call_webhook(self, webhook: str, run: dict, body: dict) -> None:
+        await asyncio.sleep(self.run_latency)
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        payload = {
+            **run,
+            "status": "success",
+            "values": {
+                "messages": [
+                    *body["input"]["messages"],
+                    {"type": "ai", "content": self._answer(body)},
+                ]
+            },
+        }
+        try:
+            async with self._session.post(webhook, json=payload) as response:
+                if response.status >= 400:
+                    self.webhook_errors += 1
+        except (aiohttp.ClientError, ConnectionError):
+            self.webhook_errors += 1
+
+    async def _stream(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        run = self._run(request.match_info["thread_id"], body)
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+
+        async def send(event: str, data) -> None:
+            await response.write(
+                f"event: {event}\ndata: {json.dumps(data)}\n\n".encode()
+            )
+
+        await send("metadata", {"run_id": run["run_id"]})
+        answer = self._answer(body)
+        step = max(1, len(answer) // self.chunks)
+        for end in range(step, len(answer) + step, step):
+            await asyncio.sleep(self.run_latency / self.chunks)
+            await send("messages/partial", [{"type": "ai", "content": answer[:end]}])
+        await send("messages/complete", [{"type": "ai", "content": answer}])
+        return response
+
+    async def _close(self, app: web.Application) -> None:
+        for task in list(self._callbacks):
+            task.cancel()
+        if self._session:
+            await self._session.close()
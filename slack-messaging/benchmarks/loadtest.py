@@ -0,0 +1,402 @@
+"""Load-test the bridge against local fake Slack and LangGraph servers.
+
+Starts the fakes, runs the bridge (langgraph_slack.server:APP under uvicorn)
+in a subprocess pointed at them, replays signed Slack message events at a
+target rate and reports throughput, queue depth and mention-to-reply latency.
+Bridge settings (WORKER_COUNT, STREAM_REPLIES, ...) are read from the
+environment as usual. Run from the slack-messaging directory:
+
+    python benchmarks/loadtest.py --rate 50 --events 1000
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from pathlib import Path
+
+import aiohttp
+from aiohttp import web
+from slack_sdk.oauth.installation_store import Installation
+from slack_sdk.oauth.installation_store.sqlite3 import SQLite3InstallationStore
+from slack_sdk.signature import SignatureVerifier
+
+from fake_services import (
+    BOT_USER_ID,
+    QUESTION,
+    QUESTION_PREFIX,
+    TEAM_ID,
+    FakeLangGraph,
+    FakeSlack,
+)
+
+SIGNING_SECRET = "loadtest-signing-secret"
+CLIENT_ID = "0000.loadtest"
+STAGE_SAMPLE = re.compile(
+    r'^slack_bridge_stage_seconds_(sum|count)\{stage="(\w+)"\} (\S+)$', re.MULTILINE
+)
+# Lift the bridge's client-side Slack rate limits unless --slack-rate-limits is
+# given, so the fake's latency and 429s are what the bridge runs into.
+UNLIMITED_RATES = {
+    method: 1_000_000
+    for method in (
+        "auth.test",
+        "chat.delete",
+        "chat.postEphemeral",
+        "chat.postMessage",
+        "chat.update",
+        "conversations.replies",
+        "users.info",
+        "users.list",
+    )
+}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def team_ids(workspaces: int) -> list[str]:
+    if workspaces == 1:
+        return [TEAM_ID]
+    return [f"{TEAM_ID}{n}" for n in range(workspaces)]
+
+
+def install_workspaces(path: str, workspaces: int) -> None:
+    """Store a bot installation for each fake workspace."""
+    store = SQLite3InstallationStore(database=path, client_id=CLIENT_ID)
+    for team_id in team_ids(workspaces):
+        store.save(
+            Installation(
+                app_id="A0LOADTEST",
+                team_id=team_id,
+                user_id="U0INSTALLER",
+                bot_token=f"xoxb-loadtest-{team_id}",
+                bot_id="B" + BOT_USER_ID,
+                bot_user_id=BOT_USER_ID,
+                bot_scopes=["chat:write"],
+            )
+        )
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return float("nan")
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))]
+
+
+def parse_stage_means(metrics: str) -> dict[str, float]:
+    """Mean seconds per stage from the bridge's /metrics (one process)."""
+    sums, counts = {}, {}
+    for match in STAGE_SAMPLE.finditer(metrics):
+        kind, stage, value = match.groups()
+        (sums if kind == "sum" else counts)[stage] = float(value)
+    return {stage: sums[stage] / count for stage, count in counts.items() if count}
+
+
+class Driver:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.slack = FakeSlack(
+            latency=args.slack_latency,
+            rate_limit_ratio=args.slack_429_ratio,
+            on_reply=self.on_reply,
+        )
+        self.langgraph = FakeLangGraph(run_latency=args.run_latency)
+        self.verifier = SignatureVerifier(SIGNING_SECRET)
+        # Send times of unanswered mentions by thread_ts, then ts.
+        self.pending: dict[str, dict[str, float]] = defaultdict(dict)
+        self.unanswered = 0
+        self.latencies: list[float] = []
+        self.ack_latencies: list[float] = []
+        self.statuses: dict[int | str, int] = {}
+        self.depths: list[int] = []
+        self.stages: dict[str, float] = {}
+        self._users = itertools.cycle([f"U{n:05d}" for n in range(args.users)])
+        self._teams = team_ids(args.workspaces)
+
+    def on_reply(self, channel: str, thread_ts: str | None, text: str) -> None:
+        # Streamed replies are edited in place; only the final text, which
+        # names the question, counts. A reply also answers earlier mentions in
+        # the thread, which were part of its context.
+        if not (match := QUESTION.search(text)) or thread_ts not in self.pending:
+            return
+        now = time.perf_counter()
+        pending = self.pending[thread_ts]
+        for ts in [ts for ts in pending if float(ts) <= float(match[1])]:
+            self.latencies.append(now - pending.pop(ts))
+            self.unanswered -= 1
+
+    def event_payload(self, channel: str, thread_ts: str | None) -> tuple[dict, str]:
+        """Return an event body and the ts of its message."""
+        ts = self.slack.next_ts()
+        # Each channel belongs to one workspace.
+        team_id = self._teams[int(channel[1:]) % len(self._teams)]
+        event = {
+            "type": "message",
+            "channel": channel,
+            "channel_type": "channel",
+            "user": next(self._users),
+            "text": f"<@{BOT_USER_ID}> {QUESTION_PREFIX}{ts}?",
+            "ts": ts,
+            "event_ts": ts,
+            "client_msg_id": str(uuid.uuid4()),
+            "team": team_id,
+        }
+        if thread_ts:
+            event["thread_ts"] = thread_ts
+        self.slack.add_message(channel, event)
+        body = {
+            "token": "loadtest",
+            "team_id": team_id,
+            "api_app_id": "A0LOADTEST",
+            "type": "event_callback",
+            "event_id": f"Ev{uuid.uuid4().hex[:10].upper()}",
+            "event_time": int(time.time()),
+            "event": event,
+        }
+        return body, ts
+
+    async def send_event(
+        self, session: aiohttp.ClientSession, url: str, channel: str, thread_ts
+    ):
+        payload, ts = self.event_payload(channel, thread_ts)
+        thread_ts = thread_ts or ts
+        self.pending[thread_ts][ts] = sent = time.perf_counter()
+        self.unanswered += 1
+        if self.args.socket_mode:
+            await self.slack.send_envelope(payload)
+            self.statuses["acked"] = self.statuses.get("acked", 0) + 1
+        else:
+            status = await self.post_event(session, url, json.dumps(payload))
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.ack_latencies.append(time.perf_counter() - sent)
+        return thread_ts
+
+    async def post_event(self, session: aiohttp.ClientSession, url: str, body: str):
+        timestamp = str(int(time.time()))
+        headers = {
+            "Content-Type": "application/json",
+            "X-Slack-Request-Timestamp": timestamp,
+            "X-Slack-Signature": self.verifier.generate_signature(
+                timestamp=timestamp, body=body
+            ),
+        }
+        async with session.post(url, data=body, headers=headers) as response:
+            return response.status
+
+    async def poll_queue(self, session: aiohttp.ClientSession, url: str):
+        while True:
+            try:
+                async with session.get(url) as response:
+                    self.depths.append((await response.json())["depth"])
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.1)
+
+    async def run(self, bridge_url: str) -> float:
+        """Send the events at the target rate and wait for the replies."""
+        args = self.args
+        threads: list[str] = []
+        async with aiohttp.ClientSession() as session:
+            poller = asyncio.ensure_future(
+                self.poll_queue(session, f"{bridge_url}/queue/stats")
+            )
+            sends = []
+            started = time.perf_counter()
+            for n in range(args.events):
+                delay = started + n / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                # Start a new thread, or follow up in an existing one. Slack
+                # limits posts per channel, so threads are spread over channels.
+                index = n % args.threads
+                thread_ts = threads[index] if len(threads) > index else None
+                channel = f"C{index % args.channels:08d}"
+                send = asyncio.ensure_future(
+                    self.send_event(
+                        session, f"{bridge_url}/events/slack", channel, thread_ts
+                    )
+                )
+                if thread_ts is None:
+                    threads.append(await send)
+                sends.append(send)
+            await asyncio.gather(*sends)
+            send_seconds = time.perf_counter() - started
+            deadline = time.perf_counter() + args.drain_timeout
+            while self.unanswered and time.perf_counter() < deadline:
+                await asyncio.sleep(0.1)
+            poller.cancel()
+            async with session.get(f"{bridge_url}/metrics") as response:
+                self.stages = parse_stage_means(await response.text())
+        return send_seconds
+
+    def report(self, send_seconds: float) -> None:
+        args = self.args
+        print(f"events sent        {args.events} in {send_seconds:.2f}s")
+        print(f"events/sec         {args.events / send_seconds:.1f}")
+        print(f"event acks         {self.statuses}")
+        print(
+            f"ack latency        p50 {percentile(self.ack_latencies, 50) * 1000:.1f}ms,"
+            f" p99 {percentile(self.ack_latencies, 99) * 1000:.1f}ms"
+        )
+        print(
+            f"answered mentions  {len(self.latencies)}"
+            f" ({self.unanswered} mentions unanswered)"
+        )
+        print(f"reply latency p50  {percentile(self.latencies, 50):.3f}s")
+        print(f"reply latency p99  {percentile(self.latencies, 99):.3f}s")
+        if self.depths:
+            print(
+                f"queue depth        max {max(self.depths)},"
+                f" mean {sum(self.depths) / len(self.depths):.1f}"
+            )
+        print(f"LangGraph runs     {self.langgraph.runs}")
+        print(f"Slack API calls    {dict(self.slack.calls)}")
+        print(f"Slack 429s         {dict(self.slack.rate_limited)}")
+        for stage, mean in self.stages.items():
+            print(f"  {stage:<17}mean {mean * 1000:.1f}ms")
+
+
+async def start_site(app: web.Application, port: int) -> web.AppRunner:
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", port).start()
+    return runner
+
+
+async def wait_until_up(url: str, process: subprocess.Popen, timeout: float = 30):
+    deadline = time.perf_counter() + timeout
+    async with aiohttp.ClientSession() as session:
+        while time.perf_counter() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError("The bridge exited during startup")
+            try:
+                async with session.get(url):
+                    return
+            except aiohttp.ClientError:
+                await asyncio.sleep(0.1)
+    raise RuntimeError("The bridge did not start in time")
+
+
+async def main(args: argparse.Namespace):
+    driver = Driver(args)
+    slack_port, langgraph_port, bridge_port = free_port(), free_port(), free_port()
+    runners = [
+        await start_site(driver.slack.app(), slack_port),
+        await start_site(driver.langgraph.app(), langgraph_port),
+    ]
+    bridge_url = f"http://127.0.0.1:{bridge_port}"
+    env = {
+        **os.environ,
+        "SLACK_BOT_TOKEN": "xoxb-loadtest",
+        "SLACK_SIGNING_SECRET": SIGNING_SECRET,
+        "SLACK_BOT_USER_ID": BOT_USER_ID,
+        "SLACK_API_URL": f"http://127.0.0.1:{slack_port}/api/",
+        "LANGGRAPH_URL": f"http://127.0.0.1:{langgraph_port}",
+        "DEPLOYMENT_URL": bridge_url,
+        "PYTHONPATH": str(Path(__file__).parent.parent / "src"),
+    }
+    if args.socket_mode:
+        env["SLACK_APP_TOKEN"] = "xapp-loadtest"
+    if not args.slack_rate_limits:
+        env["SLACK_RATE_LIMITS"] = json.dumps(UNLIMITED_RATES)
+    state_dir = tempfile.TemporaryDirectory()
+    if args.bridge_workers > 1 and "SHARED_STATE_PATH" not in env:
+        env["SHARED_STATE_PATH"] = os.path.join(state_dir.name, "state.sqlite")
+    if args.workspaces > 1:
+        env["SLACK_CLIENT_ID"] = CLIENT_ID
+        env["SLACK_CLIENT_SECRET"] = "loadtest-client-secret"
+        env["INSTALLATION_STORE_PATH"] = os.path.join(
+            state_dir.name, "installations.sqlite"
+        )
+        del env["SLACK_BOT_TOKEN"]
+        install_workspaces(env["INSTALLATION_STORE_PATH"], args.workspaces)
+    with open(args.bridge_log, "w") as log:
+        bridge = subprocess.Popen(
+            [
+                sys.executable,
+                "-m",
+                "uvicorn",
+                "langgraph_slack.server:APP",
+                "--port",
+                str(bridge_port),
+                "--workers",
+                str(args.bridge_workers),
+            ],
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            await wait_until_up(f"{bridge_url}/queue/stats", bridge)
+            while (
+                args.socket_mode and not driver.slack.sockets and bridge.poll() is None
+            ):
+                await asyncio.sleep(0.1)
+            send_seconds = await driver.run(bridge_url)
+        finally:
+            bridge.terminate()
+            bridge.wait()
+            for runner in runners:
+                await runner.cleanup()
+            state_dir.cleanup()
+    driver.report(send_seconds)
+    print(f"bridge log         {args.bridge_log}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--events", type=int, default=500)
+    parser.add_argument("--rate", type=float, default=50, help="events per second")
+    parser.add_argument(
+        "--threads", type=int, default=100, help="Slack threads to spread events over"
+    )
+    parser.add_argument(
+        "--channels", type=int, default=50, help="channels to spread threads over"
+    )
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--run-latency", type=float, default=0.5)
+    parser.add_argument("--slack-latency", type=float, default=0.02)
+    parser.add_argument("--slack-429-ratio", type=float, default=0.0)
+    parser.add_argument(
+        "--slack-rate-limits",
+        action="store_true",
+        help="keep the bridge's client-side Slack rate limits",
+    )
+    parser.add_argument(
+        "--bridge-workers",
+        type=int,
+        default=1,
+        help="uvicorn worker processes; more than one share state via SQLite",
+    )
+    parser.add_argument(
+        "--socket-mode",
+        action="store_true",
+        help="deliver events over a Socket Mode websocket instead of HTTP",
+    )
+    parser.add_argument(
+        "--workspaces",
+        type=int,
+        default=1,
+        help="Slack workspaces to spread channels over; more than one installs "
+        "the app in each through an installation store",
+    )
+    parser.add_argument("--drain-timeout", type=float, default=30)
+    parser.add_argument(
+        "--bridge-log",
+        default=os.path.join(tempfile.gettempdir(), "langgraph-slack-loadtest.log"),
+    )
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,44 @@
+"""Summarize span latencies from a TRACE_EXPORT_PATH file.
+
+slack.mention_to_reply is the whole wait, from the user's message to the
+bot's reply; the other spans are the hops within it. Run:
+
+    python benchmarks/trace_latency.py traces.jsonl
+"""
+
+import argparse
+import json
+from collections import defaultdict
+
+
+def percentile(values: list[float], pct: float) -> float:
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("path")
+    args = parser.parse_args()
+
+    durations: dict[str, list[float]] = defaultdict(list)
+    errors: dict[str, int] = defaultdict(int)
+    with open(args.path, encoding="utf-8") as file:
+        for line in file:
+            span = json.loads(line)
+            seconds = (span["endTimeUnixNano"] - span["startTimeUnixNano"]) / 1e9
+            durations[span["name"]].append(seconds)
+            if span.get("status"):
+                errors[span["name"]] += 1
+
+    print(f"{'span':<24}{'count':>8}{'errors':>8}{'p50 s':>10}{'p99 s':>10}")
+    for name, values in sorted(durations.items()):
+        print(
+            f"{name:<24}{len(values):>8}{errors[name]:>8}"
+            f"{percentile(values, 50):>10.3f}{percentile(values, 99):>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
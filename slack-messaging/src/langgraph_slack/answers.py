@@ -0,0 +1,82 @@
+import hashlib
+import json
+import re
+
+from langgraph_slack.backend import LOCAL, Backend
+
+# Scopes: an answer is reused in any channel, or only in the one it was given in.
+GLOBAL = "global"
+CHANNEL = "channel"
+SCOPES = (GLOBAL, CHANNEL)
+
+# Slack message metadata event_type of replies posted from the cache.
+CACHED_ANSWER_EVENT = "cached_answer"
+
+_MENTION = re.compile(r"<@[A-Z0-9]+>")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_question(text: str) -> str:
+    """Reduce a question to what makes it the same question: no mentions,
+    case, repeated whitespace or trailing punctuation."""
+    text = _MENTION.sub(" ", text)
+    return _SPACE.sub(" ", text).strip().rstrip("?!. ").lower()
+
+
+def is_cached_answer(msg: dict) -> bool:
+    return (msg.get("metadata") or {}).get("event_type") == CACHED_ANSWER_EVENT
+
+
+class AnswerCache:
+    """Answers to questions that start a Slack thread, keyed by the question.
+
+    Keys hash the normalized question with everything else that shapes the
+    answer: the assistant, its config, the workspace and, with the channel
+    scope, the channel. Answers are never shared between workspaces.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: float,
+        scope: str,
+        assistant_id: str,
+        graph_config: dict | None,
+        backend: Backend = LOCAL,
+    ):
+        if scope not in SCOPES:
+            raise ValueError(f"Unknown answer cache scope {scope!r}, expected {SCOPES}")
+        self.scope = scope
+        self._prefix = [assistant_id, graph_config]
+        self._answers = backend.cache("answers", maxsize, ttl)
+
+    def key(self, text: str, channel: str, team: str | None = None) -> str | None:
+        """The question's key, or None if there is no question to cache."""
+        if not (question := normalize_question(text)):
+            return None
+        scope = channel if self.scope == CHANNEL else None
+        parts = json.dumps([*self._prefix, team, scope, question], sort_keys=True)
+        return hashlib.sha256(parts.encode()).hexdigest()
+
+    def get(self, key: str) -> str | None:
+        return self._answers.get(key)
+
+    def set(self, key: str, answer: str) -> None:
+        if answer:
+            self._answers.set(key, answer)
+
+    def invalidate(
+        self, text: str | None = None, channel: str = "", team: str | None = None
+    ) -> bool:
+        """Forget the answer to one question, or every answer without text.
+
+        Returns False if there was no answer to forget.
+        """
+        if text is None:
+            self._answers.clear()
+            return True
+        key = self.key(text, channel, team)
+        return key is not None and self._answers.pop(key) is not None
+
+    def stats(self) -> dict:
+        return {**self._answers.stats(), "scope": self.scope}
@@ -0,0 +1,238 @@
+import asyncio
+import hashlib
+import importlib.util
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from slack_sdk.web.async_client import AsyncWebClient
+
+from langgraph_slack.backend import LOCAL, Backend
+
+LOGGER = logging.getLogger(__name__)
+
+# DocumentReader instance of each extraction process, loaded on first use.
+_READER = None
+# How DocumentReader's content starts when it could not read a file after all:
+# it reports missing packages and OCR errors as the file's text.
+_READER_ERRORS = (
+    "PDF extraction requires:",
+    "DOCX extraction requires:",
+    "OCR requires:",
+    "OCR failed:",
+)
+_IMAGE_FORMATS = {".png", ".jpg", ".jpeg", ".webp"}
+
+
+def load_document_reader(path: str) -> type:
+    """Import the DocumentReader class from the smart-reader skill's scripts."""
+    spec = importlib.util.spec_from_file_location(
+        "document_reader", Path(path) / "document_reader.py"
+    )
+    if spec is None or spec.loader is None:
+        raise ImportError(f"No document_reader.py in {path}")
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.DocumentReader
+
+
+def _readable_formats(extensions: set[str]) -> set[str]:
+    """The extensions among DocumentReader's that can be read here, leaving
+    out those whose optional packages or programs are not installed."""
+
+    def installed(*modules: str) -> bool:
+        return all(importlib.util.find_spec(module) for module in modules)
+
+    pdf = bool(shutil.which("pdftotext")) or installed("pdfplumber")
+    docx = installed("docx")
+    ocr = installed("PIL", "pytesseract") and bool(shutil.which("tesseract"))
+    readable = {
+        ext
+        for ext in extensions
+        if (ext != ".pdf" or pdf)
+        and (ext not in (".docx", ".doc") or docx)
+        and (ext not in _IMAGE_FORMATS or ocr)
+    }
+    if unreadable := extensions - readable:
+        LOGGER.info(
+            "Attachments of these types are skipped, as the packages or "
+            f"programs to read them are not installed: {', '.join(sorted(unreadable))}"
+        )
+    return readable
+
+
+def _read_document(reader_path: str, name: str, data: bytes) -> dict:
+    """Extract a file's text with DocumentReader. Runs in a pool process."""
+    global _READER
+    if _READER is None:
+        _READER = load_document_reader(reader_path)()
+    with tempfile.TemporaryDirectory() as tmp:
+        # Only the suffix matters to DocumentReader; the name may be anything.
+        path = os.path.join(tmp, "attachment" + Path(name).suffix.lower())
+        with open(path, "wb") as f:
+            f.write(data)
+        return _READER.read_file(path)
+
+
+class AttachmentExtractor:
+    """Text of files attached to Slack messages, for the thread context.
+
+    Files are downloaded with the bot token (which needs the files:read scope),
+    at most `concurrency` at a time, and read by DocumentReader in a pool of
+    `processes` processes, so PDF parsing and OCR never block the event loop.
+    Texts are cached by file ID and by content hash, so a file is downloaded
+    once and the same content shared again is not read twice. Content that
+    could not be read is remembered by hash too, so it is not tried again.
+    Formats whose optional packages (e.g. for OCR) are missing are skipped.
+    """
+
+    def __init__(
+        self,
+        reader_path: str,
+        concurrency: int = 4,
+        processes: int = 2,
+        max_bytes: int = 20 * 1024 * 1024,
+        max_chars: int = 20000,
+        timeout: float = 60,
+        cache_size: int = 1000,
+        backend: Backend = LOCAL,
+    ):
+        self.reader_path = reader_path
+        self.max_bytes = max_bytes
+        self.max_chars = max_chars
+        self.timeout = timeout
+        # Fails early if DocumentReader cannot be imported.
+        self.extensions = _readable_formats(
+            set(load_document_reader(reader_path)().supported_formats)
+        )
+        self.processes = processes
+        self.extracted = 0
+        self.failed = 0
+        self.skipped = 0
+        self._texts = backend.cache("attachments", cache_size)
+        self._downloads = asyncio.Semaphore(concurrency)
+        self._pool: ProcessPoolExecutor | None = None
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def supports(self, file: dict) -> bool:
+        return Path(file.get("name") or "").suffix.lower() in self.extensions
+
+    async def texts(self, client: AsyncWebClient, files: list[dict]) -> dict[str, str]:
+        """Return the text of each file that could be read, by file ID.
+
+        Files are downloaded with the client's token.
+        """
+        lookups = {}
+        for file in files:
+            if file.get("id") in lookups:
+                continue
+            if not self.supports(file) or file.get("mode") == "tombstone":
+                self.skipped += 1
+                continue
+            lookups[file["id"]] = self._lookup(client, file)
+        if not lookups:
+            return {}
+        results = await asyncio.gather(*lookups.values())
+        return {
+            file_id: text for file_id, text in zip(lookups, results) if text is not None
+        }
+
+    def _lookup(self, client: AsyncWebClient, file: dict) -> asyncio.Task:
+        file_id = file["id"]
+        if (task := self._inflight.get(file_id)) is None:
+            task = asyncio.ensure_future(self._text(client, file))
+            self._inflight[file_id] = task
+            task.add_done_callback(lambda _: self._inflight.pop(file_id, None))
+        return task
+
+    async def _text(self, client: AsyncWebClient, file: dict) -> str | None:
+        if (digest := self._texts.get(f"file:{file['id']}")) is not None:
+            if (text := self._texts.get(f"sha256:{digest}")) is not None:
+                return text
+            if self._texts.get(f"failed:{digest}") is not None:
+                return None
+        try:
+            data = await self._download(client, file)
+        except Exception as exc:
+            self.failed += 1
+            LOGGER.warning(f"Failed to download file {file['id']}: {exc}")
+            return None
+        digest = hashlib.sha256(data).hexdigest()
+        self._texts.set(f"file:{file['id']}", digest)
+        if (text := self._texts.get(f"sha256:{digest}")) is not None:
+            return text
+        if self._texts.get(f"failed:{digest}") is not None:
+            return None
+        loop = asyncio.get_running_loop()
+        try:
+            result = await asyncio.wait_for(
+                loop.run_in_executor(
+                    self._executor(),
+                    _read_document,
+                    self.reader_path,
+                    file["name"],
+                    data,
+                ),
+                self.timeout,
+            )
+        except Exception as exc:
+            result = {"success": False, "error": repr(exc)}
+        if result.get("success") and result["content"].startswith(_READER_ERRORS):
+            result = {"success": False, "error": result["content"]}
+        if not result.get("success"):
+            self.failed += 1
+            LOGGER.warning(f"Failed to read file {file['id']}: {result.get('error')}")
+            self._texts.set(f"failed:{digest}", str(result.get("error")))
+            return None
+        text = result["content"].strip()
+        if len(text) > self.max_chars:
+            text = text[: self.max_chars].rstrip() + "\n[...]"
+        self.extracted += 1
+        self._texts.set(f"sha256:{digest}", text)
+        return text
+
+    async def _download(self, client: AsyncWebClient, file: dict) -> bytes:
+        if file.get("size", 0) > self.max_bytes:
+            raise ValueError(f"{file['size']} bytes is over {self.max_bytes}")
+        url = file.get("url_private_download") or file["url_private"]
+        async with self._downloads:
+            async with client.session.get(
+                url, headers={"Authorization": f"Bearer {client.token}"}
+            ) as response:
+                response.raise_for_status()
+                # Without the files:read scope Slack serves its login page.
+                if response.content_type == "text/html":
+                    raise ValueError("got an HTML page; is files:read granted?")
+                chunks = []
+                size = 0
+                async for chunk in response.content.iter_chunked(64 * 1024):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise ValueError(f"over {self.max_bytes} bytes")
+                    chunks.append(chunk)
+        return b"".join(chunks)
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # Forking a process with running threads can deadlock the child.
+            self._pool = ProcessPoolExecutor(
+                self.processes, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._pool
+
+    def close(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {
+            **self._texts.stats(),
+            "extracted": self.extracted,
+            "failed": self.failed,
+            "skipped": self.skipped,
+            "inflight": len(self._inflight),
+        }
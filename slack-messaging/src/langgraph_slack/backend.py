@@ -0,0 +1,565 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Any, Callable, Iterable, Protocol
+
+from langgraph_slack.cache import LRUCache
+from langgraph_slack.dispatcher import (
+    BLOCK,
+    DROP_OLDEST,
+    OVERFLOW_POLICIES,
+    FairScheduler,
+    ShardedTaskQueue,
+)
+
+LOGGER = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+class Backend(Protocol):
+    """Where the bridge keeps its task queue and caches.
+
+    LocalBackend keeps them in process. A shared backend lets several bridge
+    processes (uvicorn --workers, or replicas) share one queue, so callbacks
+    and messages can be handled by any process while tasks for a LangGraph
+    thread still run one at a time and in order.
+    """
+
+    def cache(
+        self,
+        namespace: str,
+        maxsize: int,
+        ttl: float | None = None,
+        dumps: Callable[[Any], str] = json.dumps,
+        loads: Callable[[str], Any] = json.loads,
+    ) -> LRUCache:
+        """Return a cache with LRUCache's interface.
+
+        dumps and loads serialize values for backends that store them outside
+        the process.
+        """
+        ...
+
+    def task_queue(
+        self,
+        num_workers: int,
+        maxsize: int,
+        block_timeout: float | None,
+        on_drop: Callable[[dict], None] | None,
+        weights: dict[str, float] | None = None,
+    ) -> ShardedTaskQueue:
+        """Return a queue with ShardedTaskQueue's interface."""
+        ...
+
+
+class LocalBackend:
+    """Keeps everything in this process: the default for a single worker."""
+
+    def cache(self, namespace, maxsize, ttl=None, dumps=None, loads=None):
+        return LRUCache(maxsize, ttl)
+
+    def task_queue(self, num_workers, maxsize, block_timeout, on_drop, weights=None):
+        return ShardedTaskQueue(
+            num_workers,
+            maxsize=maxsize,
+            block_timeout=block_timeout,
+            on_drop=on_drop,
+            weights=weights,
+        )
+
+
+LOCAL = LocalBackend()
+
+
+class SQLiteBackend:
+    """Shares the queue and caches between processes through a SQLite file.
+
+    Every process on the host opens the same file (WAL mode, so readers do not
+    block the writer). The file must be on a local disk; bridge replicas on
+    different hosts need a backend built on a network store instead.
+
+    Caches are read and written on the event loop, so they have a connection
+    of their own that waits at most cache_busy_timeout seconds for another
+    process's write lock; the queue's transactions run in threads.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        lease_seconds: float = 120,
+        poll_interval=0.05,
+        cache_busy_timeout: float = 0.05,
+    ):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.cache_busy_timeout = cache_busy_timeout
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None, timeout=30
+        )
+        self._lock = threading.Lock()
+        self._cache_conn = sqlite3.connect(
+            path,
+            check_same_thread=False,
+            isolation_level=None,
+            timeout=cache_busy_timeout,
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " namespace TEXT NOT NULL,"
+            " key TEXT NOT NULL,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL,"
+            " updated_at REAL NOT NULL,"
+            " PRIMARY KEY (namespace, key)) WITHOUT ROWID;"
+            "CREATE INDEX IF NOT EXISTS cache_updated"
+            " ON cache (namespace, updated_at);"
+            "CREATE TABLE IF NOT EXISTS queue ("
+            " seq INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " thread_key TEXT NOT NULL,"
+            " type TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " enqueued_at REAL NOT NULL,"
+            " lease_until REAL,"
+            " owner TEXT,"
+            " priority INTEGER NOT NULL DEFAULT 0,"
+            " tag REAL NOT NULL DEFAULT 0);"
+            "CREATE INDEX IF NOT EXISTS queue_thread ON queue (thread_key, seq);"
+        )
+
+    def execute(self, sql: str, params=()) -> list[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def execute_cache(self, sql: str, params=()) -> list[tuple]:
+        """Like execute, but raises sqlite3.OperationalError rather than wait
+        long for a lock held by another process."""
+        # Statements of this process are serialized, so that they never wait
+        # on each other's locks inside SQLite, which sleeps in coarse steps.
+        if not self._lock.acquire(timeout=self.cache_busy_timeout):
+            raise sqlite3.OperationalError("backend busy in this process")
+        try:
+            return self._cache_conn.execute(sql, params).fetchall()
+        finally:
+            self._lock.release()
+
+    def transaction(self, func: Callable[[sqlite3.Connection], Any]):
+        """Run func in a write transaction, serialized across processes."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = func(self._conn)
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+            return result
+
+    def cache(self, namespace, maxsize, ttl=None, dumps=json.dumps, loads=json.loads):
+        return SharedCache(self, namespace, maxsize, ttl, dumps, loads)
+
+    def task_queue(self, num_workers, maxsize, block_timeout, on_drop, weights=None):
+        return SharedTaskQueue(
+            self, num_workers, maxsize * num_workers, block_timeout, on_drop, weights
+        )
+
+
+class SharedCache:
+    """An LRUCache stand-in stored in a SQLiteBackend.
+
+    Lookups are synchronous, like LRUCache's; on a local SQLite file in WAL
+    mode they take tens of microseconds. If the file stays locked by another
+    process for longer than the backend's cache_busy_timeout, a lookup is a
+    miss and a write is skipped, rather than stall the event loop. Entries are
+    evicted oldest-written first, in batches, so the cache can briefly hold a
+    little over maxsize. Hit, miss and busy counts are per process.
+    """
+
+    def __init__(
+        self,
+        backend: SQLiteBackend,
+        namespace: str,
+        maxsize: int,
+        ttl: float | None = None,
+        dumps: Callable[[Any], str] = json.dumps,
+        loads: Callable[[str], Any] = json.loads,
+    ):
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, got {maxsize}")
+        self.backend = backend
+        self.namespace = namespace
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.dumps = dumps
+        self.loads = loads
+        self.hits = 0
+        self.misses = 0
+        self.busy = 0
+        self._sets_until_trim = self._trim_every = max(1, maxsize // 10)
+
+    def _execute(self, sql: str, params=()) -> list[tuple] | None:
+        """Run a statement, or return None if the file is locked."""
+        try:
+            return self.backend.execute_cache(sql, params)
+        except sqlite3.OperationalError as exc:
+            self.busy += 1
+            LOGGER.debug(f"Shared {self.namespace} cache busy: {exc}")
+            return None
+
+    def __len__(self) -> int:
+        rows = self._execute(
+            "SELECT COUNT(*) FROM cache WHERE namespace = ?", (self.namespace,)
+        )
+        return rows[0][0] if rows else 0
+
+    def __contains__(self, key) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, count: bool = True):
+        rows = self._execute(
+            "SELECT value, expires_at FROM cache WHERE namespace = ? AND key = ?",
+            (self.namespace, json.dumps(key)),
+        )
+        if rows and (rows[0][1] is None or rows[0][1] > time.time()):
+            if count:
+                self.hits += 1
+            return self.loads(rows[0][0])
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key, value) -> None:
+        now = time.time()
+        inserted = self._execute(
+            "INSERT OR REPLACE INTO cache"
+            " (namespace, key, value, expires_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+            (
+                self.namespace,
+                json.dumps(key),
+                self.dumps(value),
+                now + self.ttl if self.ttl is not None else None,
+                now,
+            ),
+        )
+        self._sets_until_trim -= 1
+        if inserted is not None and self._sets_until_trim <= 0:
+            self._sets_until_trim = self._trim_every
+            self._trim(now)
+
+    def _trim(self, now: float) -> None:
+        self._execute(
+            "DELETE FROM cache WHERE namespace = ? AND expires_at < ?",
+            (self.namespace, now),
+        )
+        self._execute(
+            "DELETE FROM cache WHERE namespace = ? AND key IN ("
+            " SELECT key FROM cache WHERE namespace = ?"
+            " ORDER BY updated_at DESC LIMIT -1 OFFSET ?)",
+            (self.namespace, self.namespace, self.maxsize),
+        )
+
+    def pop(self, key, default=None):
+        rows = self._execute(
+            "DELETE FROM cache WHERE namespace = ? AND key = ? RETURNING value",
+            (self.namespace, json.dumps(key)),
+        )
+        return self.loads(rows[0][0]) if rows else default
+
+    def clear(self) -> None:
+        self._execute("DELETE FROM cache WHERE namespace = ?", (self.namespace,))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+            "busy": self.busy,
+        }
+
+
+class SharedTaskQueue:
+    """A task queue stored in a SQLiteBackend and consumed by every process.
+
+    Tasks with the same key (a LangGraph thread ID) are taken strictly in
+    order: only the oldest task of a key can be taken, and only once the task
+    before it has been marked done(). A taken task is leased to its process,
+    which renews the lease every third of lease_seconds until the task is
+    done, however long it runs; if the process dies, the lease runs out and
+    another process retries it.
+    Among the tasks that can be taken, the order is by priority, then by
+    FairScheduler tag within the priority. Each process tags the tasks it
+    enqueues, with the virtual time kept in step with the queue's lowest tag,
+    so fairness across processes is approximate.
+
+    It has ShardedTaskQueue's interface. Each worker is given the queue itself
+    as its shard, and maxsize applies to the queue as a whole.
+    """
+
+    def __init__(
+        self,
+        backend: SQLiteBackend,
+        num_workers: int,
+        maxsize: int = 0,
+        block_timeout: float | None = None,
+        on_drop: Callable[[dict], None] | None = None,
+        weights: dict[str, float] | None = None,
+    ):
+        if num_workers < 1:
+            raise ValueError(f"num_workers must be at least 1, got {num_workers}")
+        self.backend = backend
+        self.maxsize = maxsize
+        self.block_timeout = block_timeout
+        self.on_drop = on_drop
+        # Only used from within backend transactions, which are serialized.
+        self.schedulers: defaultdict[int, FairScheduler] = defaultdict(
+            lambda: FairScheduler(weights)
+        )
+        self.shards = [self] * num_workers
+        self.dropped: Counter[str] = Counter()
+        self.rejected: Counter[str] = Counter()
+        self._closed = False
+        # Idle workers wait here. Only one of them polls the database for tasks
+        # queued by other processes; the rest wait to be notified, one at a
+        # time, when a task may have become available.
+        self._changed = asyncio.Condition()
+        self._polling = False
+        # Finished tasks, deleted along with the worker's next claim to save a
+        # round trip per task.
+        self._finished: list[int] = []
+        # Tasks this process has taken and not finished, whose leases it renews.
+        self._held: set[int] = set()
+        self._renewer: asyncio.Task | None = None
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    async def put(
+        self,
+        key: str,
+        task: dict,
+        policy: str = BLOCK,
+        priority: int = 0,
+        flows: Iterable[str] = (),
+    ) -> bool:
+        """Enqueue a task, applying the overflow policy.
+
+        Lower priorities are served first; flows are the fair-queuing flows
+        the task counts against. Returns False if the task was rejected.
+        """
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown queue policy: {policy}")
+        payload = json.dumps(task)
+        # Like TaskQueue, wait without a limit if there is no timeout.
+        deadline = time.monotonic() + (
+            math.inf if self.block_timeout is None else self.block_timeout
+        )
+        while True:
+            accepted, dropped = await asyncio.to_thread(
+                self.backend.transaction,
+                lambda conn: self._insert(
+                    conn, key, task["type"], payload, policy, priority, flows
+                ),
+            )
+            if accepted:
+                break
+            if policy != BLOCK or time.monotonic() >= deadline:
+                self.rejected[task["type"]] += 1
+                LOGGER.warning(f"Queue full, rejected {task['type']} task")
+                return False
+            await asyncio.sleep(self.backend.poll_interval)
+        await self._wake_one()
+        if dropped:
+            self.dropped[dropped["type"]] += 1
+            LOGGER.warning(f"Queue full, dropped oldest {dropped['type']} task")
+            if self.on_drop:
+                self.on_drop(dropped)
+        return True
+
+    def _insert(self, conn, key, task_type, payload, policy, priority, flows):
+        dropped = None
+        if self.maxsize:
+            (size,) = conn.execute("SELECT COUNT(*) FROM queue").fetchone()
+            if size >= self.maxsize:
+                if policy != DROP_OLDEST:
+                    return False, None
+                oldest = conn.execute(
+                    "DELETE FROM queue WHERE seq = ("
+                    " SELECT seq FROM queue WHERE lease_until IS NULL"
+                    " OR lease_until < ? ORDER BY seq LIMIT 1) RETURNING payload",
+                    (time.time(),),
+                ).fetchone()
+                if oldest is None:
+                    return False, None
+                dropped = json.loads(oldest[0])
+        scheduler = self.schedulers[priority]
+        (lowest_tag,) = conn.execute(
+            "SELECT MIN(tag) FROM queue WHERE priority = ?", (priority,)
+        ).fetchone()
+        if lowest_tag is not None:
+            scheduler.advance(lowest_tag)
+        conn.execute(
+            "INSERT INTO queue"
+            " (thread_key, type, payload, enqueued_at, priority, tag)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                key,
+                task_type,
+                payload,
+                time.time(),
+                priority,
+                scheduler.tag(flows),
+            ),
+        )
+        return True, dropped
+
+    async def get(self) -> tuple[dict | None, float]:
+        """Take the next task and return it with its wait, or None once closed."""
+        while not self._closed:
+            finished, self._finished = self._finished, []
+            try:
+                row = await asyncio.to_thread(
+                    self.backend.transaction, lambda conn: self._claim(conn, finished)
+                )
+            except BaseException:
+                # Not deleted; try again with the next claim.
+                self._finished[:0] = finished
+                raise
+            if row:
+                # There may be more; let another idle worker look.
+                await self._wake_one()
+                seq, payload, enqueued_at = row
+                self._held.add(seq)
+                if self._renewer is None:
+                    self._renewer = asyncio.create_task(self._renew_leases())
+                task = json.loads(payload)
+                task["queue_seq"] = seq
+                return task, max(0.0, time.time() - enqueued_at)
+            await self._idle()
+        await self._delete_finished()
+        return None, 0.0
+
+    async def _renew_leases(self) -> None:
+        while True:
+            await asyncio.sleep(self.backend.lease_seconds / 3)
+            if not (held := list(self._held)):
+                continue
+            lease_until = time.time() + self.backend.lease_seconds
+            try:
+                await asyncio.to_thread(
+                    self.backend.transaction,
+                    lambda conn: conn.executemany(
+                        "UPDATE queue SET lease_until = ? WHERE seq = ? AND owner = ?",
+                        [(lease_until, seq, self.backend.owner) for seq in held],
+                    ),
+                )
+            except sqlite3.Error as exc:
+                LOGGER.warning(f"Failed to renew {len(held)} task leases: {exc}")
+
+    async def _idle(self) -> None:
+        async with self._changed:
+            if self._closed:
+                return
+            if self._polling:
+                await self._changed.wait()
+                return
+            self._polling = True
+            try:
+                await asyncio.wait_for(self._changed.wait(), self.backend.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._polling = False
+
+    async def _wake_one(self) -> None:
+        async with self._changed:
+            self._changed.notify(1)
+
+    def _claim(self, conn, finished: list[int]):
+        conn.executemany(
+            "DELETE FROM queue WHERE seq = ?", [(seq,) for seq in finished]
+        )
+        now = time.time()
+        row = conn.execute(
+            "SELECT seq, payload, enqueued_at, priority, tag FROM queue AS task"
+            " WHERE (lease_until IS NULL OR lease_until < ?)"
+            " AND seq = (SELECT MIN(seq) FROM queue"
+            "  WHERE thread_key = task.thread_key)"
+            " ORDER BY priority, tag, seq LIMIT 1",
+            (now,),
+        ).fetchone()
+        if not row:
+            return None
+        conn.execute(
+            "UPDATE queue SET lease_until = ?, owner = ? WHERE seq = ?",
+            (now + self.backend.lease_seconds, self.backend.owner, row[0]),
+        )
+        self.schedulers[row[3]].advance(row[4])
+        return row[:3]
+
+    async def done(self, task: dict) -> None:
+        """Mark a task finished, letting the next one of its key be taken.
+
+        The task is deleted with the worker's next get().
+        """
+        if seq := task.get("queue_seq"):
+            self._held.discard(seq)
+            self._finished.append(seq)
+
+    async def _delete_finished(self) -> None:
+        if finished := self._finished:
+            self._finished = []
+            try:
+                await asyncio.to_thread(
+                    self.backend.transaction,
+                    lambda conn: conn.executemany(
+                        "DELETE FROM queue WHERE seq = ?", [(seq,) for seq in finished]
+                    ),
+                )
+            except BaseException:
+                self._finished[:0] = finished
+                raise
+
+    def qsize(self) -> int:
+        return self.backend.execute("SELECT COUNT(*) FROM queue")[0][0]
+
+    def oldest_age(self) -> float:
+        oldest = self.backend.execute("SELECT MIN(enqueued_at) FROM queue")[0][0]
+        return max(0.0, time.time() - oldest) if oldest else 0.0
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.qsize(),
+            "oldest_task_age_seconds": round(self.oldest_age(), 3),
+            # One queue shared by every worker of every process.
+            "shard_depths": [self.qsize()],
+            "maxsize": self.maxsize,
+            "dropped": dict(self.dropped),
+            "rejected": dict(self.rejected),
+        }
+
+    async def close(self) -> None:
+        """Stop handing out tasks; queued ones stay for other processes.
+
+        Leases of tasks left unfinished are no longer renewed, so other
+        processes take them over once they run out.
+        """
+        self._closed = True
+        if self._renewer is not None:
+            self._renewer.cancel()
+        async with self._changed:
+            self._changed.notify_all()
+        await self._delete_finished()
@@ -0,0 +1,76 @@
+import time
+from collections import OrderedDict
+from typing import Generic, Hashable, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+_MISSING = object()
+
+
+class LRUCache(Generic[K, V]):
+    """A size-bounded mapping that evicts the least recently used entry.
+
+    If ttl (seconds) is set, entries also expire that long after being stored.
+    """
+
+    def __init__(self, maxsize: int, ttl: float | None = None):
+        if maxsize < 1:
+            raise ValueError(f"maxsize must be at least 1, got {maxsize}")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[K, tuple[float, V]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: K) -> bool:
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key: K, default=None, count: bool = True):
+        entry = self._data.get(key)
+        if entry is not None and (self.ttl is None or entry[0] > time.monotonic()):
+            self._data.move_to_end(key)
+            if count:
+                self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._data[key]
+        if count:
+            self.misses += 1
+        return default
+
+    def set(self, key: K, value: V) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl is not None else 0.0
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key: K, default=None):
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def values(self) -> list[V]:
+        """The unexpired values, least recently used first."""
+        now = time.monotonic()
+        return [
+            value
+            for expires, value in self._data.values()
+            if self.ttl is None or expires > now
+        ]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else None,
+        }
@@ -0,0 +1,81 @@
+import asyncio
+
+import orjson
+from fastapi import Request
+
+# Bodies at least this large are parsed in a thread, off the event loop.
+THREAD_PARSE_BYTES = 64 * 1024
+
+
+class PayloadTooLarge(Exception):
+    pass
+
+
+class CallbackReader:
+    """Reads LangGraph webhook callbacks, keeping only what is needed to reply.
+
+    A callback carries the run's whole state, every message of the thread
+    included, but only the last message is posted to Slack. Keeping just that
+    keeps queued (and journaled) callback tasks small however long the thread
+    gets. Bodies over max_bytes (0 for no limit) are refused.
+    """
+
+    def __init__(self, max_bytes: int = 0):
+        self.max_bytes = max_bytes
+        self.count = 0
+        self.total_bytes = 0
+        self.max_seen_bytes = 0
+        self.too_large = 0
+
+    async def read(self, req: Request) -> tuple[dict, int]:
+        """Return the parsed callback and its size in bytes.
+
+        Raises PayloadTooLarge if the body is over the cap.
+        """
+        body = await self._read_body(req)
+        self.count += 1
+        self.total_bytes += len(body)
+        self.max_seen_bytes = max(self.max_seen_bytes, len(body))
+        if len(body) >= THREAD_PARSE_BYTES:
+            return await asyncio.to_thread(parse_callback, body), len(body)
+        return parse_callback(body), len(body)
+
+    async def _read_body(self, req: Request) -> bytes:
+        if not self.max_bytes:
+            return await req.body()
+        length = req.headers.get("content-length")
+        if length and length.isdigit() and int(length) > self.max_bytes:
+            self.too_large += 1
+            raise PayloadTooLarge(f"{length} bytes")
+        chunks = []
+        size = 0
+        async for chunk in req.stream():
+            size += len(chunk)
+            if size > self.max_bytes:
+                self.too_large += 1
+                raise PayloadTooLarge(f"over {self.max_bytes} bytes")
+            chunks.append(chunk)
+        return b"".join(chunks)
+
+    def stats(self) -> dict:
+        return {
+            "count": self.count,
+            "mean_bytes": round(self.total_bytes / self.count) if self.count else None,
+            "max_bytes": self.max_seen_bytes,
+            "too_large": self.too_large,
+        }
+
+
+def parse_callback(body: bytes) -> dict:
+    """Parse a callback body down to the fields the bridge uses."""
+    payload = orjson.loads(body)
+    values = payload.get("values")
+    if not isinstance(values, dict):
+        values = {}
+    return {
+        "run_id": payload.get("run_id"),
+        "thread_id": payload["thread_id"],
+        "status": payload.get("status"),
+        "metadata": payload.get("metadata") or {},
+        "values": {"messages": (values.get("messages") or [])[-1:]},
+    }
@@ -0,0 +1,75 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable
+
+LOGGER = logging.getLogger(__name__)
+
+
+@dataclass
+class _Burst:
+    first_at: float
+    events: list[dict] = field(default_factory=list)
+    timer: asyncio.TimerHandle | None = None
+
+
+class MessageCoalescer:
+    """Debounce messages per thread so a burst becomes a single task.
+
+    Each new message for a key restarts that key's window. The burst is handed
+    to `flush` once no message has arrived for `window` seconds, or `max_wait`
+    seconds after its first message, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        window: float,
+        max_wait: float,
+        flush: Callable[[list[dict]], Awaitable[None]],
+    ):
+        self.window = window
+        self.max_wait = max(max_wait, window)
+        self.flush = flush
+        self.merged = 0
+        self._bursts: dict[str, _Burst] = {}
+        self._flushing: set[asyncio.Task] = set()
+
+    def add(self, key: str, event: dict) -> None:
+        now = time.monotonic()
+        burst = self._bursts.get(key)
+        if burst is None:
+            burst = self._bursts[key] = _Burst(first_at=now)
+        else:
+            burst.timer.cancel()
+            self.merged += 1
+        burst.events.append(event)
+        delay = min(self.window, burst.first_at + self.max_wait - now)
+        burst.timer = asyncio.get_running_loop().call_later(
+            max(delay, 0), self._release, key
+        )
+
+    def _release(self, key: str) -> None:
+        burst = self._bursts.pop(key)
+        if len(burst.events) > 1:
+            LOGGER.info("Coalesced %d messages for thread %s", len(burst.events), key)
+        task = asyncio.ensure_future(self._flush(key, burst.events))
+        self._flushing.add(task)
+        task.add_done_callback(self._flushing.discard)
+
+    async def _flush(self, key: str, events: list[dict]) -> None:
+        try:
+            await self.flush(events)
+        except Exception as exc:
+            LOGGER.exception(f"Error flushing messages for thread {key}: {exc}")
+
+    def pending(self) -> int:
+        return sum(len(burst.events) for burst in self._bursts.values())
+
+    async def close(self) -> None:
+        """Release every pending burst now and wait for them to be flushed."""
+        for key, burst in list(self._bursts.items()):
+            burst.timer.cancel()
+            self._release(key)
+        if self._flushing:
+            await asyncio.gather(*self._flushing, return_exceptions=True)
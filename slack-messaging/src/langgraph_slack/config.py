@@ -1,5 +1,9 @@
 from os import environ
+import json
 import logging
+from pathlib import Path
+
+from langgraph_slack.dispatcher import OVERFLOW_POLICIES
 
 LOGGER = logging.getLogger(__name__)
 
@@ -7,13 +11,34 @@ if DEPLOY_MODAL := environ.get("DEPLOY_MODAL"):
     DEPLOY_MODAL = DEPLOY_MODAL.lower() == "true"
 BOT_USER_ID = environ.get("SLACK_BOT_USER_ID")
 BOT_TOKEN = environ.get("SLACK_BOT_TOKEN")
+SIGNING_SECRET = environ.get("SLACK_SIGNING_SECRET")
+# With an OAuth client ID and secret, the app is installed into workspaces at
+# /slack/install and one bridge serves all of them, instead of the single
+# workspace of SLACK_BOT_TOKEN. Installations are kept in the SQLite file at
+# INSTALLATION_STORE_PATH. Each workspace gets its own Slack client and caches,
+# kept for the WORKSPACE_CACHE_SIZE most recently active workspaces.
+CLIENT_ID = environ.get("SLACK_CLIENT_ID")
+CLIENT_SECRET = environ.get("SLACK_CLIENT_SECRET")
+MULTI_WORKSPACE = bool(CLIENT_ID and CLIENT_SECRET)
+OAUTH_SCOPES = environ.get(
+    "SLACK_SCOPES",
+    "app_mentions:read,channels:history,channels:join,channels:read,chat:write,"
+    "chat:write.public,files:read,groups:history,groups:read,im:history,im:read,"
+    "im:write,mpim:history,users:read",
+).split(",")
+INSTALLATION_STORE_PATH = environ.get(
+    "INSTALLATION_STORE_PATH", "slack_installations.db"
+)
+WORKSPACE_CACHE_SIZE = int(environ.get("WORKSPACE_CACHE_SIZE", "100"))
 if DEPLOY_MODAL:
     if not environ.get("SLACK_BOT_TOKEN"):
         environ["SLACK_BOT_TOKEN"] = "fake-token"
     BOT_USER_ID = BOT_USER_ID or "fake-user-id"
-else:
+elif not MULTI_WORKSPACE:
     assert isinstance(BOT_TOKEN, str)
-    # APP_TOKEN = environ["SLACK_APP_TOKEN"]
+# With an app-level token (xapp-...), events are received over a Socket Mode
+# websocket as well as at /events/slack.
+APP_TOKEN = environ.get("SLACK_APP_TOKEN")
 
 
 LANGGRAPH_URL = environ.get("LANGGRAPH_URL")
@@ -21,3 +46,211 @@ ASSISTANT_ID = environ.get("LANGGRAPH_ASSISTANT_ID", "chat")
 CONFIG = environ.get("CONFIG") or "{}"
 DEPLOYMENT_URL = environ.get("DEPLOYMENT_URL", "")
 SLACK_CHANNEL_ID = environ.get("SLACK_CHANNEL_ID")
+# Base URL of the Slack Web API, e.g. a local fake for load tests.
+SLACK_API_URL = environ.get("SLACK_API_URL")
+
+# Number of background workers. Tasks are sharded across workers by LangGraph
+# thread, so a slow thread only delays tasks that hash to the same worker.
+WORKER_COUNT = int(environ.get("WORKER_COUNT", "8"))
+
+# Maximum number of queued tasks per worker, and what to do with a new task of
+# each type when its worker's queue is full: "block" (wait up to
+# QUEUE_BLOCK_TIMEOUT seconds, then reject), "drop-oldest" or "reject". Rejected
+# Slack messages get an ephemeral BUSY_MESSAGE reply; rejected callbacks a 503.
+QUEUE_MAXSIZE = int(environ.get("QUEUE_MAXSIZE", "100"))
+QUEUE_BLOCK_TIMEOUT = float(environ.get("QUEUE_BLOCK_TIMEOUT", "10"))
+QUEUE_POLICIES = {
+    "slack_message": environ.get("QUEUE_POLICY_SLACK_MESSAGE", "reject"),
+    "callback": environ.get("QUEUE_POLICY_CALLBACK", "block"),
+}
+for _task_type, _policy in QUEUE_POLICIES.items():
+    if _policy not in OVERFLOW_POLICIES:
+        raise ValueError(
+            f"Invalid queue policy {_policy!r} for {_task_type} tasks, "
+            f"expected one of {OVERFLOW_POLICIES}"
+        )
+# Each worker serves LangGraph callbacks first, then direct messages, then
+# channel messages. Within each class, channels and users get a fair share of
+# the workers, in proportion to their weight in QUEUE_WEIGHTS, a JSON object of
+# channel or user ID to weight (default 1), e.g. {"C0123": 4, "U0456": 0.5}.
+QUEUE_WEIGHTS = json.loads(environ.get("QUEUE_WEIGHTS") or "{}")
+for _flow, _weight in QUEUE_WEIGHTS.items():
+    if not isinstance(_weight, (int, float)) or _weight <= 0:
+        raise ValueError(f"Invalid queue weight {_weight!r} for {_flow}")
+BUSY_MESSAGE = environ.get(
+    "BUSY_MESSAGE",
+    "I'm handling a lot of requests right now. Please try again in a minute.",
+)
+
+# Path of a SQLite file used to journal queued tasks so they survive restarts.
+# Unset keeps the queue in memory only.
+TASK_JOURNAL_PATH = environ.get("TASK_JOURNAL_PATH")
+TASK_JOURNAL_FLUSH_INTERVAL = float(environ.get("TASK_JOURNAL_FLUSH_INTERVAL", "0.02"))
+# Path of a SQLite file through which several bridge processes on one host
+# (uvicorn --workers N, or replicas sharing a volume) share the task queue and
+# caches. Tasks for a LangGraph thread still run one at a time and in order. A
+# task taken by a process that dies is retried by another once its lease of
+# SHARED_QUEUE_LEASE seconds runs out; live processes keep renewing theirs. The
+# shared queue is durable, so TASK_JOURNAL_PATH is not used with it. Unset keeps
+# all state in the process.
+SHARED_STATE_PATH = environ.get("SHARED_STATE_PATH")
+SHARED_QUEUE_LEASE = float(environ.get("SHARED_QUEUE_LEASE", "120"))
+# LangGraph webhook callbacks larger than CALLBACK_MAX_BYTES are refused with a
+# 413, and the user gets the BUSY_MESSAGE reply. They carry the run's whole
+# state, so they grow with the thread. 0 disables the limit.
+CALLBACK_MAX_BYTES = int(environ.get("CALLBACK_MAX_BYTES", str(32 * 1024 * 1024)))
+
+# Connections kept open to Slack and to LangGraph. In the background on
+# startup, the bot identity is resolved and WARM_CONNECTIONS connections to each
+# are opened, so the first messages after a deploy do not wait on TLS
+# handshakes. Idle connections are closed after HTTP_KEEPALIVE seconds.
+# LangGraph requests fail if a connection cannot be made within
+# LANGGRAPH_CONNECT_TIMEOUT or a read takes longer than LANGGRAPH_TIMEOUT
+# seconds.
+SLACK_POOL_SIZE = int(environ.get("SLACK_POOL_SIZE", "100"))
+LANGGRAPH_POOL_SIZE = int(environ.get("LANGGRAPH_POOL_SIZE", "100"))
+HTTP_KEEPALIVE = float(environ.get("HTTP_KEEPALIVE", "60"))
+WARM_CONNECTIONS = int(environ.get("WARM_CONNECTIONS", "2"))
+LANGGRAPH_CONNECT_TIMEOUT = float(environ.get("LANGGRAPH_CONNECT_TIMEOUT", "5"))
+LANGGRAPH_TIMEOUT = float(environ.get("LANGGRAPH_TIMEOUT", "300"))
+
+# Seconds to let workers finish queued tasks on shutdown before cancelling them.
+SHUTDOWN_DRAIN_TIMEOUT = float(environ.get("SHUTDOWN_DRAIN_TIMEOUT", "20"))
+
+# Number of Slack threads whose recent history is cached in memory. 0 disables
+# the cache, so every mention fetches the whole thread.
+THREAD_HISTORY_CACHE_SIZE = int(environ.get("THREAD_HISTORY_CACHE_SIZE", "1000"))
+
+# Slack display names are cached for up to USER_CACHE_SIZE users, each for
+# USER_CACHE_TTL seconds. With USER_DIRECTORY_WARMUP=true the whole workspace is
+# loaded with users.list on startup.
+USER_CACHE_SIZE = int(environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = float(environ.get("USER_CACHE_TTL", "3600"))
+USER_DIRECTORY_WARMUP = environ.get("USER_DIRECTORY_WARMUP", "").lower() == "true"
+
+# Messages for the same thread that arrive within COALESCE_WINDOW seconds of
+# each other are sent to LangGraph as one run, delayed by at most
+# COALESCE_MAX_WAIT seconds. 0 disables coalescing.
+COALESCE_WINDOW = float(environ.get("COALESCE_WINDOW", "0"))
+COALESCE_MAX_WAIT = float(environ.get("COALESCE_MAX_WAIT", "5"))
+
+# Stream replies: post STREAM_PLACEHOLDER as soon as a run starts and edit it
+# with the answer as it is generated, at most once every
+# STREAM_UPDATE_INTERVAL seconds. Without it, the reply is posted once the run
+# finishes and LangGraph calls the webhook.
+STREAM_REPLIES = environ.get("STREAM_REPLIES", "").lower() == "true"
+STREAM_UPDATE_INTERVAL = float(environ.get("STREAM_UPDATE_INTERVAL", "1.5"))
+STREAM_PLACEHOLDER = environ.get("STREAM_PLACEHOLDER", "_Thinking..._")
+# Replaces the placeholder (or follows the partial answer) when a streamed run
+# fails; a run that ends without an answer has its placeholder deleted.
+STREAM_ERROR_MESSAGE = environ.get(
+    "STREAM_ERROR_MESSAGE", "_Sorry, something went wrong. Please try again._"
+)
+
+# Slack API calls are scheduled within Slack's per-method rate limits.
+# SLACK_RATE_LIMITS is a JSON object overriding calls per minute by method name,
+# e.g. {"conversations.replies": 1}. Rate-limited calls are retried after
+# Retry-After, up to SLACK_MAX_RETRIES times.
+SLACK_RATE_LIMITS = environ.get("SLACK_RATE_LIMITS") or "{}"
+SLACK_MAX_RETRIES = int(environ.get("SLACK_MAX_RETRIES", "3"))
+
+# Event IDs and client message IDs are remembered for EVENT_DEDUP_TTL seconds
+# (at most EVENT_DEDUP_SIZE of them) so redelivered events are only handled once.
+EVENT_DEDUP_TTL = float(environ.get("EVENT_DEDUP_TTL", "600"))
+EVENT_DEDUP_SIZE = int(environ.get("EVENT_DEDUP_SIZE", "50000"))
+
+# Token budget for the thread context sent with each message. Older messages
+# that do not fit are replaced by summaries of CONTEXT_SEGMENT_SIZE messages
+# each, made by CONTEXT_SUMMARY_MODEL (a LangChain chat model such as
+# "openai:gpt-4o-mini") or, if unset, by keeping the first line of each message.
+# 0 sends the whole context verbatim.
+CONTEXT_TOKEN_BUDGET = int(environ.get("CONTEXT_TOKEN_BUDGET", "0"))
+CONTEXT_SEGMENT_SIZE = int(environ.get("CONTEXT_SEGMENT_SIZE", "20"))
+CONTEXT_SUMMARY_MODEL = environ.get("CONTEXT_SUMMARY_MODEL")
+CONTEXT_SUMMARY_CACHE_SIZE = int(environ.get("CONTEXT_SUMMARY_CACHE_SIZE", "1000"))
+
+# Only send LangGraph the Slack messages a thread has not been sent yet, rather
+# than the whole context since the last bot reply. The newest forwarded ts is
+# remembered for up to FORWARDED_TS_CACHE_SIZE threads; threads without one get
+# the full context.
+DELTA_INPUT = environ.get("DELTA_INPUT", "").lower() == "true"
+FORWARDED_TS_CACHE_SIZE = int(environ.get("FORWARDED_TS_CACHE_SIZE", "10000"))
+
+# Text of files attached to the messages in the context (PDF, DOCX, images
+# through OCR, text) is read with the smart-reader skill's DocumentReader, found
+# in DOCUMENT_READER_PATH, and added to the context when ATTACHMENTS is true.
+# Needs the files:read scope.
+# ATTACHMENT_CONCURRENCY files are downloaded at a time and read in
+# ATTACHMENT_PROCESSES processes. Files over ATTACHMENT_MAX_BYTES, or not read
+# within ATTACHMENT_TIMEOUT seconds, are left out, and texts are cut to
+# ATTACHMENT_MAX_CHARS. Texts of up to ATTACHMENT_CACHE_SIZE files are cached.
+ATTACHMENTS = environ.get("ATTACHMENTS", "").lower() == "true"
+DOCUMENT_READER_PATH = environ.get(
+    "DOCUMENT_READER_PATH",
+    str(
+        Path(__file__).resolve().parents[3]
+        / "aladdin-engine"
+        / "skills"
+        / "smart-reader"
+        / "scripts"
+    ),
+)
+ATTACHMENT_CONCURRENCY = int(environ.get("ATTACHMENT_CONCURRENCY", "4"))
+ATTACHMENT_PROCESSES = int(environ.get("ATTACHMENT_PROCESSES", "2"))
+ATTACHMENT_MAX_BYTES = int(environ.get("ATTACHMENT_MAX_BYTES", str(20 * 1024 * 1024)))
+ATTACHMENT_MAX_CHARS = int(environ.get("ATTACHMENT_MAX_CHARS", "20000"))
+ATTACHMENT_TIMEOUT = float(environ.get("ATTACHMENT_TIMEOUT", "60"))
+ATTACHMENT_CACHE_SIZE = int(environ.get("ATTACHMENT_CACHE_SIZE", "1000"))
+
+# Cache the answers to questions that start a thread for ANSWER_CACHE_TTL
+# seconds (0 disables the cache), so the same question asked again is answered
+# without a LangGraph run. With ANSWER_CACHE_SCOPE "channel" answers are only
+# reused in the channel they were given in; "global" reuses them everywhere.
+ANSWER_CACHE_TTL = float(environ.get("ANSWER_CACHE_TTL", "0"))
+ANSWER_CACHE_SIZE = int(environ.get("ANSWER_CACHE_SIZE", "1000"))
+ANSWER_CACHE_SCOPE = environ.get("ANSWER_CACHE_SCOPE", "channel")
+# Bearer token required by DELETE /answers; unset leaves the route out.
+ANSWER_CACHE_ADMIN_TOKEN = environ.get("ANSWER_CACHE_ADMIN_TOKEN")
+
+# Append trace spans covering each mention, from the Slack message to the
+# reply, to this JSONL file. The trace ID travels in run metadata and comes back
+# in the webhook callback. Unset disables writing spans.
+TRACE_EXPORT_PATH = environ.get("TRACE_EXPORT_PATH")
+
+# Sample the stacks of worker tasks every PROFILE_INTERVAL seconds and write a
+# flamegraph-ready .folded file plus a .json stage breakdown to PROFILE_DIR for
+# every PROFILE_EVERY-th task (0: none) and every task that takes at least
+# PROFILE_SLOW_SECONDS (0: none). The oldest profiles are deleted to keep the
+# directory under PROFILE_MAX_BYTES. Unset PROFILE_DIR disables profiling.
+PROFILE_DIR = environ.get("PROFILE_DIR")
+PROFILE_EVERY = int(environ.get("PROFILE_EVERY", "0"))
+PROFILE_SLOW_SECONDS = float(environ.get("PROFILE_SLOW_SECONDS", "10"))
+PROFILE_INTERVAL = float(environ.get("PROFILE_INTERVAL", "0.01"))
+PROFILE_MAX_BYTES = int(environ.get("PROFILE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# Log records are handed to a background thread through a queue of
+# LOG_QUEUE_SIZE records (dropped when full), and formatted and written there,
+# as text or, with LOG_FORMAT "json", one JSON object per line. LOG_SAMPLING is
+# a JSON object of logger name to the share of its records below WARNING that
+# are kept, e.g. {"httpx": 0.01, "langgraph_slack.server": 0.1}. Fields named
+# in LOG_REDACT are masked, and strings logged in fields and arguments are cut
+# to LOG_MAX_FIELD_CHARS.
+LOG_LEVEL = environ.get("LOG_LEVEL", "INFO")
+LOG_FORMAT = environ.get("LOG_FORMAT", "text")
+if LOG_FORMAT not in ("text", "json"):
+    raise ValueError(f"Invalid LOG_FORMAT {LOG_FORMAT!r}, expected text or json")
+LOG_QUEUE_SIZE = int(environ.get("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLING = json.loads(environ.get("LOG_SAMPLING") or "{}")
+for _logger, _rate in LOG_SAMPLING.items():
+    if not isinstance(_rate, (int, float)) or not 0 <= _rate <= 1:
+        raise ValueError(f"Invalid log sampling rate {_rate!r} for {_logger}")
+LOG_REDACT = {
+    key.strip()
+    for key in environ.get(
+        "LOG_REDACT",
+        "token,bot_token,access_token,client_secret,authorization,"
+        "signing_secret,password",
+    ).split(",")
+    if key.strip()
+}
+LOG_MAX_FIELD_CHARS = int(environ.get("LOG_MAX_FIELD_CHARS", "1000"))
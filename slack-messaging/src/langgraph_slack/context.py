@@ -0,0 +1,165 @@
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, NamedTuple
+
+from langgraph_slack.backend import LOCAL, Backend
+
+LOGGER = logging.getLogger(__name__)
+
+SUMMARY_PROMPT = (
+    "Summarize this excerpt of a Slack thread in a few sentences. Keep names, "
+    "decisions, numbers and open questions. Reply with the summary only."
+)
+
+
+class ContextMessage(NamedTuple):
+    speaker: str
+    text: str
+
+
+Summarizer = Callable[[list[ContextMessage]], Awaitable[str]]
+
+
+def render_message(msg: ContextMessage) -> str:
+    return f'<slackMessage user="{msg.speaker}">{msg.text}</slackMessage>'
+
+
+def estimate_tokens(text: str) -> int:
+    # Roughly four characters per token for English text.
+    return len(text) // 4 + 1
+
+
+async def extractive_summary(
+    messages: list[ContextMessage], max_chars: int = 80
+) -> str:
+    """Summarize messages by keeping the first line of each, shortened."""
+    lines = []
+    for msg in messages:
+        first_line = msg.text.strip().split("\n", 1)[0]
+        if len(first_line) > max_chars:
+            first_line = first_line[:max_chars].rstrip() + "..."
+        lines.append(f"{msg.speaker}: {first_line}")
+    return "\n".join(lines)
+
+
+def llm_summarizer(model: str) -> Summarizer:
+    """Summarize messages with a chat model, e.g. "openai:gpt-4o-mini"."""
+    from langchain.chat_models import init_chat_model
+
+    llm = init_chat_model(model)
+
+    async def summarize(messages: list[ContextMessage]) -> str:
+        transcript = "\n".join(render_message(msg) for msg in messages)
+        response = await llm.ainvoke([("system", SUMMARY_PROMPT), ("user", transcript)])
+        if isinstance(response.content, str):
+            return response.content
+        return "".join(
+            block.get("text", "")
+            for block in response.content
+            if isinstance(block, dict)
+        )
+
+    return summarize
+
+
+class ContextBuilder:
+    """Fits the preceding messages of a thread into a token budget.
+
+    The newest messages are kept verbatim. Older messages are split into
+    segments of segment_size messages, counted from the start of the context
+    so that segment boundaries stay put as the thread grows, and each segment is
+    replaced by a summary. Only full segments are summarized: the messages
+    after the last one stay verbatim until the segment fills up, so a segment
+    never changes once summarized. Summaries are cached by thread and segment
+    content, so each one is only computed once. If even the summaries do not
+    fit, the oldest ones are left out.
+    """
+
+    # Share of the budget for verbatim messages; the rest is for summaries.
+    VERBATIM_SHARE = 0.75
+
+    def __init__(
+        self,
+        token_budget: int,
+        summarize: Summarizer = extractive_summary,
+        segment_size: int = 20,
+        cache_size: int = 1000,
+        backend: Backend = LOCAL,
+    ):
+        self.token_budget = token_budget
+        self.summarize = summarize
+        self.segment_size = segment_size
+        self._summaries = backend.cache("context_summaries", cache_size)
+
+    async def build(
+        self, thread_key: str, messages: list[ContextMessage], reserved: int = 0
+    ) -> list[str]:
+        """Render messages, oldest first, within the budget minus `reserved`."""
+        budget = self.token_budget - reserved
+        rendered = [render_message(msg) for msg in messages]
+        used = 0
+        split = len(messages)
+        while split > 0:
+            cost = estimate_tokens(rendered[split - 1])
+            if used + cost > budget * self.VERBATIM_SHARE:
+                break
+            used += cost
+            split -= 1
+        if split == 0:
+            return rendered
+
+        # The start of a segment that is not full yet stays verbatim too.
+        summarized = split - split % self.segment_size
+        pending = rendered[summarized:split]
+        used += sum(estimate_tokens(part) for part in pending)
+        if used > budget:
+            # Too long to keep verbatim; shorten it without the summarizer,
+            # whose summary of a growing segment could not be reused.
+            short = await extractive_summary(messages[summarized:split])
+            pending = [
+                f'<slackSummary messages="{split - summarized}">{short}</slackSummary>'
+            ]
+            used += estimate_tokens(pending[0]) - sum(
+                estimate_tokens(part) for part in rendered[summarized:split]
+            )
+        segments = [
+            messages[start : start + self.segment_size]
+            for start in range(0, summarized, self.segment_size)
+        ]
+        summaries = await asyncio.gather(
+            *(self._summary(thread_key, segment) for segment in segments)
+        )
+        kept: list[str] = []
+        omitted = summarized
+        for segment, summary in zip(reversed(segments), reversed(summaries)):
+            part = f'<slackSummary messages="{len(segment)}">{summary}</slackSummary>'
+            cost = estimate_tokens(part)
+            if used + cost > budget:
+                break
+            used += cost
+            omitted -= len(segment)
+            kept.append(part)
+        kept.reverse()
+        if omitted:
+            kept.insert(0, f"({omitted} earlier messages omitted)")
+        return kept + pending + rendered[split:]
+
+    async def _summary(self, thread_key: str, segment: list[ContextMessage]) -> str:
+        digest = hashlib.sha256(
+            "\x00".join(f"{msg.speaker}\x01{msg.text}" for msg in segment).encode()
+        ).hexdigest()
+        key = (thread_key, digest)
+        if (summary := self._summaries.get(key)) is not None:
+            return summary
+        try:
+            summary = await self.summarize(segment)
+        except Exception as exc:
+            # Not cached, so the next message retries the summarizer.
+            LOGGER.warning(f"Falling back to extractive summary: {exc}")
+            return await extractive_summary(segment)
+        self._summaries.set(key, summary)
+        return summary
+
+    def stats(self) -> dict:
+        return self._summaries.stats()
@@ -0,0 +1,37 @@
+from collections import Counter
+
+from langgraph_slack.backend import LOCAL, Backend
+
+
+class EventDeduplicator:
+    """Remembers recently seen Slack event keys to drop redelivered events.
+
+    IDs are remembered per kind (event_id, client_msg_id, ...) for ttl
+    seconds, up to maxsize IDs in total.
+    """
+
+    def __init__(self, maxsize: int, ttl: float, backend: Backend = LOCAL):
+        self._seen = backend.cache("dedup", maxsize, ttl)
+        self.suppressed: Counter[str] = Counter()
+
+    def check_and_add(self, reason: str, **ids: str | None) -> bool:
+        """Record the given IDs, returning True if any was already seen.
+
+        IDs that are None are ignored. Duplicates are counted under `reason`.
+        """
+        keys = [f"{kind}:{value}" for kind, value in ids.items() if value]
+        duplicate = any(key in self._seen for key in keys)
+        for key in keys:
+            self._seen.set(key, True)
+        if duplicate:
+            self.suppressed[reason] += 1
+        return duplicate
+
+    def discard(self, **ids: str | None) -> None:
+        """Forget IDs, e.g. so Slack's retry of a failed delivery is handled."""
+        for kind, value in ids.items():
+            if value:
+                self._seen.pop(f"{kind}:{value}")
+
+    def stats(self) -> dict:
+        return {"tracked": len(self._seen), "suppressed": dict(self.suppressed)}
@@ -0,0 +1,274 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+import zlib
+from collections import Counter, defaultdict, deque
+from typing import Callable, Iterable
+
+LOGGER = logging.getLogger(__name__)
+
+# What to do with a new task when its shard is full.
+BLOCK = "block"  # wait for space, up to a timeout, then reject
+DROP_OLDEST = "drop-oldest"  # evict the oldest queued task to make room
+REJECT = "reject"  # refuse the new task
+OVERFLOW_POLICIES = (BLOCK, DROP_OLDEST, REJECT)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class FairScheduler:
+    """Assigns tasks weighted fair queuing tags over the flows they belong to.
+
+    A task's tag for each of its flows (e.g. its Slack channel and its user) is
+    1/weight past the later of the virtual time and that flow's previous tag;
+    the task gets the largest of these. Serving tasks in tag order gives every
+    busy flow a share of the work proportional to its weight, so one noisy flow
+    cannot hold up the others. Tasks without flows get the virtual time, i.e.
+    are served in arrival order.
+    """
+
+    def __init__(self, weights: dict[str, float] | None = None):
+        self.weights = weights or {}
+        self.virtual_time = 0.0
+        self._finish: dict[str, float] = {}
+
+    def tag(self, flows: Iterable[str]) -> float:
+        tag = self.virtual_time
+        for flow in flows:
+            finish = max(self.virtual_time, self._finish.get(flow, 0.0))
+            finish += 1 / self.weights.get(flow, 1)
+            self._finish[flow] = finish
+            tag = max(tag, finish)
+        return tag
+
+    def advance(self, tag: float) -> None:
+        """Move the virtual time up to the tag of a task being served."""
+        if tag <= self.virtual_time:
+            return
+        self.virtual_time = tag
+        if len(self._finish) > 10_000:
+            # Flows that are not ahead of the virtual time are as good as new.
+            self._finish = {
+                flow: finish
+                for flow, finish in self._finish.items()
+                if finish > self.virtual_time
+            }
+
+
+class TaskQueue:
+    """A bounded queue that remembers when each task was enqueued.
+
+    Tasks are served by priority (lower values first), then by their
+    FairScheduler tag; each priority has a scheduler of its own. Tasks with the
+    same key are always served in the order they were enqueued: only the oldest
+    task of each key is eligible.
+    """
+
+    def __init__(self, maxsize: int = 0, weights: dict[str, float] | None = None):
+        self.maxsize = maxsize
+        self.schedulers: defaultdict[int, FairScheduler] = defaultdict(
+            lambda: FairScheduler(weights)
+        )
+        # (enqueued_at, key, task, priority, tag) by sequence number, oldest
+        # first, and the sequence numbers of each key's tasks.
+        self._entries: dict[int, tuple[float, str, dict, int, float]] = {}
+        self._keys: dict[str, deque[int]] = {}
+        # (priority, tag, seq) of the oldest task of each key. Entries of
+        # dropped tasks are skipped when they come up.
+        self._ready: list[tuple[int, float, int]] = []
+        self._seq = itertools.count()
+        self._closed = False
+        self._changed = asyncio.Condition()
+
+    def qsize(self) -> int:
+        return len(self._entries)
+
+    def full(self) -> bool:
+        return 0 < self.maxsize <= len(self._entries)
+
+    def oldest_age(self) -> float:
+        if not self._entries:
+            return 0.0
+        return time.monotonic() - next(iter(self._entries.values()))[0]
+
+    async def put(
+        self,
+        key: str,
+        task: dict,
+        timeout: float | None = None,
+        priority: int = 0,
+        flows: Iterable[str] = (),
+    ) -> None:
+        """Wait until there is room for the task, raising QueueFull on timeout."""
+        async with self._changed:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait_for(lambda: not self.full()), timeout
+                )
+            except asyncio.TimeoutError:
+                raise QueueFull() from None
+            self._append(key, task, priority, flows)
+
+    async def put_nowait(
+        self, key: str, task: dict, priority: int = 0, flows: Iterable[str] = ()
+    ) -> None:
+        async with self._changed:
+            if self.full():
+                raise QueueFull()
+            self._append(key, task, priority, flows)
+
+    async def put_drop_oldest(
+        self, key: str, task: dict, priority: int = 0, flows: Iterable[str] = ()
+    ) -> dict | None:
+        """Enqueue the task, evicting and returning the oldest task if full."""
+        dropped = None
+        async with self._changed:
+            if self.full():
+                dropped = self._remove(next(iter(self._entries)))[2]
+            self._append(key, task, priority, flows)
+        return dropped
+
+    def _append(
+        self, key: str, task: dict, priority: int, flows: Iterable[str]
+    ) -> None:
+        # Callers must hold self._changed.
+        seq = next(self._seq)
+        tag = self.schedulers[priority].tag(flows)
+        self._entries[seq] = (time.monotonic(), key, task, priority, tag)
+        seqs = self._keys.setdefault(key, deque())
+        seqs.append(seq)
+        if len(seqs) == 1:
+            heapq.heappush(self._ready, (priority, tag, seq))
+        self._changed.notify_all()
+
+    def _remove(self, seq: int) -> tuple[float, str, dict, int, float]:
+        """Remove the oldest task of its key, making the next one eligible."""
+        entry = self._entries.pop(seq)
+        seqs = self._keys[entry[1]]
+        seqs.popleft()
+        if seqs:
+            _, _, _, priority, tag = self._entries[seqs[0]]
+            heapq.heappush(self._ready, (priority, tag, seqs[0]))
+        else:
+            del self._keys[entry[1]]
+        return entry
+
+    async def get(self) -> tuple[dict | None, float]:
+        """Return the next task and how long it waited in the queue.
+
+        Once the queue is closed and empty, returns None.
+        """
+        async with self._changed:
+            await self._changed.wait_for(lambda: self._entries or self._closed)
+            if not self._entries:
+                return None, 0.0
+            while self._ready[0][2] not in self._entries:
+                heapq.heappop(self._ready)
+            priority, tag, seq = heapq.heappop(self._ready)
+            enqueued_at, _, task, _, _ = self._remove(seq)
+            self.schedulers[priority].advance(tag)
+            self._changed.notify_all()
+        return task, time.monotonic() - enqueued_at
+
+    async def close(self) -> None:
+        """Let the worker exit once the queued tasks are done."""
+        async with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+
+
+class ShardedTaskQueue:
+    """A set of task queues, one per worker, selected by a routing key.
+
+    Tasks that share a key (a LangGraph thread ID) always land on the same shard,
+    so they are processed in order, while tasks for different threads can be
+    processed concurrently by different workers. Within a shard, tasks are
+    served by priority and then fairly across flows (see FairScheduler), with
+    flow weights given by `weights`.
+    """
+
+    def __init__(
+        self,
+        num_shards: int,
+        maxsize: int = 0,
+        block_timeout: float | None = None,
+        on_drop: Callable[[dict], None] | None = None,
+        weights: dict[str, float] | None = None,
+    ):
+        if num_shards < 1:
+            raise ValueError(f"num_shards must be at least 1, got {num_shards}")
+        self.shards = [TaskQueue(maxsize, weights) for _ in range(num_shards)]
+        self.block_timeout = block_timeout
+        # Called with each task evicted by the drop-oldest policy.
+        self.on_drop = on_drop
+        self.dropped: Counter[str] = Counter()
+        self.rejected: Counter[str] = Counter()
+
+    def __len__(self) -> int:
+        return len(self.shards)
+
+    def shard_index(self, key: str) -> int:
+        # crc32 rather than hash() so routing is stable across processes.
+        return zlib.crc32(key.encode()) % len(self.shards)
+
+    async def put(
+        self,
+        key: str,
+        task: dict,
+        policy: str = BLOCK,
+        priority: int = 0,
+        flows: Iterable[str] = (),
+    ) -> bool:
+        """Enqueue a task on its shard, applying the overflow policy.
+
+        Lower priorities are served first; flows are the fair-queuing flows
+        the task counts against. Returns False if the task was rejected.
+        """
+        shard = self.shards[self.shard_index(key)]
+        try:
+            if policy == BLOCK:
+                await shard.put(key, task, self.block_timeout, priority, flows)
+            elif policy == REJECT:
+                await shard.put_nowait(key, task, priority, flows)
+            elif policy == DROP_OLDEST:
+                if dropped := await shard.put_drop_oldest(key, task, priority, flows):
+                    self.dropped[dropped["type"]] += 1
+                    LOGGER.warning(f"Queue full, dropped oldest {dropped['type']} task")
+                    if self.on_drop:
+                        self.on_drop(dropped)
+            else:
+                raise ValueError(f"Unknown queue policy: {policy}")
+        except QueueFull:
+            self.rejected[task["type"]] += 1
+            LOGGER.warning(f"Queue full, rejected {task['type']} task")
+            return False
+        return True
+
+    async def done(self, task: dict) -> None:
+        """Mark a task finished. Tasks leave these queues when taken, so this
+        is a no-op, kept for compatibility with shared queues."""
+
+    def qsize(self) -> int:
+        return sum(shard.qsize() for shard in self.shards)
+
+    def oldest_age(self) -> float:
+        return max(shard.oldest_age() for shard in self.shards)
+
+    def stats(self) -> dict:
+        return {
+            "depth": self.qsize(),
+            "oldest_task_age_seconds": round(self.oldest_age(), 3),
+            "shard_depths": [shard.qsize() for shard in self.shards],
+            "maxsize_per_shard": self.shards[0].maxsize,
+            "dropped": dict(self.dropped),
+            "rejected": dict(self.rejected),
+        }
+
+    async def close(self) -> None:
+        """Close every shard so each worker exits once it has drained."""
+        for shard in self.shards:
+            await shard.close()
@@ -0,0 +1,117 @@
+import json
+from dataclasses import asdict, dataclass, field
+
+from langgraph_slack import config
+from langgraph_slack.answers import is_cached_answer
+from langgraph_slack.backend import LOCAL, Backend
+
+# Subtypes that change messages we may already have cached.
+_EDIT_SUBTYPES = {"message_changed", "message_deleted"}
+
+
+def is_bot_message(msg: dict, bot_user_id: str | None = None) -> bool:
+    return msg.get("bot_id") == (bot_user_id or config.BOT_USER_ID)
+
+
+def is_bot_reply(msg: dict, bot_user_id: str | None = None) -> bool:
+    """A bot message that came from the LangGraph thread, so that the context
+    sent with the next message starts after it. Replies from the answer cache
+    never reached the thread, so they do not count."""
+    return is_bot_message(msg, bot_user_id) and not is_cached_answer(msg)
+
+
+@dataclass
+class _Thread:
+    messages: list[dict] = field(default_factory=list)
+    # Newest ts returned by conversations.replies. Every message up to it has
+    # been seen, whereas messages added from events may have gaps before them.
+    synced_ts: str | None = None
+
+
+class ThreadHistoryCache:
+    """Recent messages of Slack threads, keyed by (channel, thread_ts).
+
+    Only messages from the last bot reply onwards are kept, since that is all the
+    contextual message uses. The cache is kept current from incoming events, and
+    refresh_from() tells the caller which `oldest` ts to pass to
+    conversations.replies so that only new messages are fetched.
+    """
+
+    def __init__(
+        self, maxsize: int, backend: Backend = LOCAL, bot_user_id: str | None = None
+    ):
+        # The bot whose replies end the context; config.BOT_USER_ID if None.
+        self.bot_user_id = bot_user_id
+        self._threads = backend.cache(
+            "thread_history",
+            maxsize,
+            dumps=lambda thread: json.dumps(asdict(thread)),
+            loads=lambda value: _Thread(**json.loads(value)),
+        )
+
+    def get(self, channel: str, thread_ts: str) -> list[dict] | None:
+        thread = self._threads.get((channel, thread_ts))
+        return list(thread.messages) if thread else None
+
+    def refresh_from(self, channel: str, thread_ts: str) -> str | None:
+        """Return the ts to fetch newer messages from, or None if not cached."""
+        thread = self._threads.get((channel, thread_ts), count=False)
+        if not thread:
+            return None
+        candidates = [thread.synced_ts] if thread.synced_ts else []
+        if thread.messages and is_bot_reply(thread.messages[0], self.bot_user_id):
+            candidates.append(thread.messages[0]["ts"])
+        return max(candidates, key=float) if candidates else None
+
+    def store(
+        self, channel: str, thread_ts: str, messages: list[dict], replace: bool
+    ) -> list[dict]:
+        """Merge fetched messages into the thread and return its history.
+
+        With replace=True the fetched messages are taken as the full thread.
+        """
+        key = (channel, thread_ts)
+        thread = None if replace else self._threads.get(key, count=False)
+        if thread is None:
+            thread = _Thread()
+        self._merge(thread, messages)
+        if messages:
+            newest = max(messages, key=lambda msg: float(msg["ts"]))["ts"]
+            if not thread.synced_ts or float(newest) > float(thread.synced_ts):
+                thread.synced_ts = newest
+        self._threads.set(key, thread)
+        return list(thread.messages)
+
+    def add_event(self, event: dict) -> None:
+        """Apply a Slack message event to the cached thread, if any."""
+        if event.get("subtype") in _EDIT_SUBTYPES:
+            msg = event.get("message") or event.get("previous_message") or {}
+            if thread_ts := msg.get("thread_ts") or msg.get("ts"):
+                self.invalidate(event["channel"], thread_ts)
+            return
+        if not event.get("ts") or not event.get("channel"):
+            return
+        thread_ts = event.get("thread_ts") or event["ts"]
+        self.add_message(event["channel"], thread_ts, event)
+
+    def add_message(self, channel: str, thread_ts: str, msg: dict) -> None:
+        key = (channel, thread_ts)
+        if thread := self._threads.get(key, count=False):
+            self._merge(thread, [msg])
+            self._threads.set(key, thread)
+
+    def invalidate(self, channel: str, thread_ts: str) -> None:
+        self._threads.pop((channel, thread_ts))
+
+    def stats(self) -> dict:
+        return self._threads.stats()
+
+    def _merge(self, thread: _Thread, messages: list[dict]) -> None:
+        by_ts = {msg["ts"]: msg for msg in thread.messages}
+        by_ts.update((msg["ts"], msg) for msg in messages)
+        merged = sorted(by_ts.values(), key=lambda msg: float(msg["ts"]))
+        for i in range(len(merged) - 1, -1, -1):
+            if is_bot_reply(merged[i], self.bot_user_id):
+                merged = merged[i:]
+                break
+        thread.messages = merged
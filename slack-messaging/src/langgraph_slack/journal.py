@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TaskJournal:
+    """A SQLite (WAL mode) log of tasks that have been queued but not finished.
+
+    Appends are group-committed: callers wait until the batch containing their
+    task is on disk, but many tasks share one commit. Acks are buffered and
+    written with the next batch, so a crash can replay a task that had already
+    finished (at-least-once delivery).
+    """
+
+    def __init__(self, path: str, flush_interval: float = 0.02, batch_size: int = 256):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self._conn: sqlite3.Connection | None = None
+        self._conn_lock = threading.Lock()
+        self._inserts: list[tuple[str, str, str, float]] = []
+        self._waiters: list[asyncio.Future] = []
+        self._acks: set[str] = set()
+        self._wakeup = asyncio.Event()
+        self._flusher: asyncio.Task | None = None
+
+    def open(self) -> list[dict]:
+        """Open the journal and return the unacknowledged tasks, oldest first."""
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tasks ("
+            " id TEXT PRIMARY KEY,"
+            " type TEXT NOT NULL,"
+            " payload TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        rows = self._conn.execute(
+            "SELECT id, payload FROM tasks ORDER BY created_at, rowid"
+        ).fetchall()
+        pending = []
+        for task_id, payload in rows:
+            task = json.loads(payload)
+            task["journal_id"] = task_id
+            pending.append(task)
+        self._flusher = asyncio.get_running_loop().create_task(self._flush_loop())
+        LOGGER.info(f"Opened task journal {self.path}: {len(pending)} pending tasks")
+        return pending
+
+    async def append(self, task: dict) -> None:
+        """Record a task and wait until it is committed.
+
+        Sets task["journal_id"], which must be passed to ack() once the task is
+        done.
+        """
+        task_id = uuid.uuid4().hex
+        payload = json.dumps(task)
+        task["journal_id"] = task_id
+        waiter = asyncio.get_running_loop().create_future()
+        self._inserts.append((task_id, task["type"], payload, time.time()))
+        self._waiters.append(waiter)
+        if len(self._inserts) >= self.batch_size:
+            self._wakeup.set()
+        await waiter
+
+    def ack(self, task: dict) -> None:
+        """Mark a task as finished so it is not replayed."""
+        if task_id := task.get("journal_id"):
+            self._acks.add(task_id)
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not (self._inserts or self._acks):
+            return
+        inserts, self._inserts = self._inserts, []
+        waiters, self._waiters = self._waiters, []
+        acks, self._acks = self._acks, set()
+        try:
+            await asyncio.to_thread(self._write, inserts, acks)
+        except Exception as exc:
+            LOGGER.exception(f"Failed to write task journal: {exc}")
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_exception(exc)
+            return
+        for waiter in waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+
+    def _write(self, inserts: list[tuple[str, str, str, float]], acks: set[str]):
+        with self._conn_lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO tasks (id, type, payload, created_at)"
+                " VALUES (?, ?, ?, ?)",
+                inserts,
+            )
+            self._conn.executemany(
+                "DELETE FROM tasks WHERE id = ?", [(task_id,) for task_id in acks]
+            )
+
+    async def close(self) -> None:
+        if self._flusher:
+            self._flusher.cancel()
+            self._flusher = None
+        await self.flush()
+        with self._conn_lock:
+            if self._conn:
+                self._conn.close()
+                self._conn = None
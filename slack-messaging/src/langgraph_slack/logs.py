@@ -0,0 +1,210 @@
+import json
+import logging
+import logging.handlers
+import queue
+import random
+import sys
+import time
+
+# Attributes every LogRecord has; anything else was passed in `extra`.
+_RECORD_FIELDS = set(logging.makeLogRecord({}).__dict__) | {"message", "asctime"}
+REDACTED = "[redacted]"
+
+
+class Redactor:
+    """Copies log fields with secret keys masked and long strings cut short."""
+
+    def __init__(self, keys: set[str], max_chars: int = 1000):
+        self.keys = {key.lower() for key in keys}
+        self.max_chars = max_chars
+
+    def clean(self, value, depth: int = 0):
+        if isinstance(value, str):
+            if self.max_chars and len(value) > self.max_chars:
+                return f"{value[: self.max_chars]}...[{len(value)} chars]"
+            return value
+        if depth > 8:
+            return "..."
+        if isinstance(value, dict):
+            return {
+                key: (
+                    REDACTED
+                    if str(key).lower() in self.keys
+                    else self.clean(item, depth + 1)
+                )
+                for key, item in value.items()
+            }
+        if isinstance(value, (list, tuple)):
+            return [self.clean(item, depth + 1) for item in value]
+        return value
+
+
+def record_fields(record: logging.LogRecord) -> dict:
+    """The structured fields passed to a log call in `extra`."""
+    return {
+        key: value
+        for key, value in record.__dict__.items()
+        if key not in _RECORD_FIELDS
+    }
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: time, level, logger, message and fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(record.created))
+            + f".{int(record.msecs):03d}Z",
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **record_fields(record),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps only a share of each logger's records below WARNING.
+
+    `rates` maps logger names to the share kept, e.g. {"httpx": 0.01}; a
+    logger without a rate of its own takes its nearest parent's.
+    """
+
+    def __init__(self, rates: dict[str, float]):
+        super().__init__()
+        self.rates = rates
+        self.dropped = 0
+        self._resolved: dict[str, float] = {}
+
+    def _rate(self, name: str) -> float:
+        if (rate := self._resolved.get(name)) is None:
+            parent = name
+            while parent not in self.rates and "." in parent:
+                parent = parent.rsplit(".", 1)[0]
+            rate = self._resolved[name] = self.rates.get(parent, 1.0)
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self._rate(record.name)
+        if rate >= 1 or random.random() < rate:
+            return True
+        self.dropped += 1
+        return False
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the log thread without formatting them.
+
+    The stock QueueHandler formats every record in the thread that logs it (so
+    it could be pickled for a process queue). Here the message, the JSON and
+    the traceback are all built on the log thread instead. Long strings among
+    the arguments are cut short, and containers among the arguments and fields
+    are copied, with secrets masked, so that later changes to them are not
+    logged. When the queue is full, records are dropped rather than waiting on
+    a slow disk.
+    """
+
+    def __init__(self, log_queue: queue.Queue, redactor: Redactor):
+        super().__init__(log_queue)
+        self.redactor = redactor
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.args, dict):
+            record.args = self.redactor.clean(record.args)
+        elif record.args:
+            # Only strings and containers are changed; numbers are kept as
+            # they are, for formats like %d.
+            record.args = tuple(self.redactor.clean(arg) for arg in record.args)
+        for key, value in record_fields(record).items():
+            if isinstance(value, (dict, list, tuple)) or key.lower() in (
+                self.redactor.keys
+            ):
+                setattr(record, key, self.redactor.clean({key: value})[key])
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class LogPipeline:
+    """Routes every log record through a queue to a thread that writes it.
+
+    Nothing changes until start(), which replaces the root logger's handlers
+    (and those of the `take_over` loggers); close() writes out what is queued
+    and puts the previous handlers back.
+    """
+
+    def __init__(
+        self,
+        level: str = "INFO",
+        json_format: bool = False,
+        sampling: dict[str, float] | None = None,
+        redact: set[str] | None = None,
+        max_chars: int = 1000,
+        queue_size: int = 10000,
+        take_over: tuple[str, ...] = ("uvicorn", "uvicorn.access", "uvicorn.error"),
+    ):
+        self.level = level.upper()
+        self.take_over = take_over
+        self.redactor = Redactor(redact or set(), max_chars)
+        output = logging.StreamHandler(sys.stderr)
+        output.setFormatter(
+            JsonFormatter()
+            if json_format
+            else logging.Formatter(
+                "%(asctime)s %(levelname)s %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
+            )
+        )
+        self.handler = DeferredQueueHandler(queue.Queue(queue_size), self.redactor)
+        self.sampling = SamplingFilter(sampling or {})
+        self.handler.addFilter(self.sampling)
+        self.listener = logging.handlers.QueueListener(self.handler.queue, output)
+        # Handlers, propagation and level of each logger taken over, to restore.
+        self._previous: dict[str | None, tuple[list, bool, int]] = {}
+
+    def start(self) -> None:
+        root = logging.getLogger()
+        self._previous[None] = (root.handlers[:], root.propagate, root.level)
+        for handler in root.handlers[:]:
+            root.removeHandler(handler)
+        root.addHandler(self.handler)
+        root.setLevel(self.level)
+        # Servers like uvicorn give their loggers handlers of their own, which
+        # would write from the event loop; send them through the queue too.
+        for name in self.take_over:
+            logger = logging.getLogger(name)
+            self._previous[name] = (logger.handlers[:], logger.propagate, logger.level)
+            for handler in logger.handlers[:]:
+                logger.removeHandler(handler)
+            logger.propagate = True
+        self.listener.start()
+
+    def close(self) -> None:
+        """Write out the queued records and restore the previous handlers."""
+        for name, (handlers, propagate, level) in self._previous.items():
+            logger = logging.getLogger(name)
+            for handler in logger.handlers[:]:
+                logger.removeHandler(handler)
+            for handler in handlers:
+                logger.addHandler(handler)
+            logger.propagate = propagate
+            logger.setLevel(level)
+        self._previous.clear()
+        self.listener.stop()
+
+    def stats(self) -> dict:
+        return {
+            "queued": self.handler.queue.qsize(),
+            "dropped_full": self.handler.dropped,
+            "dropped_sampled": self.sampling.dropped,
+        }
@@ -0,0 +1,201 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, Protocol
+
+from prometheus_client import CollectorRegistry, Counter, Histogram
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+REGISTRY = CollectorRegistry()
+
+# Stages of handling a Slack message or a LangGraph callback, in order.
+STAGES = (
+    "queue_wait",
+    "history_fetch",
+    "user_names",
+    "attachments",
+    "context_build",
+    "runs_create",
+    "stream_reply",
+    "callback_post",
+    "callback_to_post",
+)
+
+STAGE_SECONDS = Histogram(
+    "slack_bridge_stage_seconds",
+    "Time spent in each stage of handling a task.",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+    registry=REGISTRY,
+)
+TASKS = Counter(
+    "slack_bridge_tasks_total",
+    "Tasks processed by the workers, by type and outcome.",
+    ["type", "outcome"],
+    registry=REGISTRY,
+)
+LANGGRAPH_ERRORS = Counter(
+    "slack_bridge_langgraph_errors_total",
+    "Failed LangGraph API calls, by HTTP status ('error' if there was none).",
+    ["status"],
+    registry=REGISTRY,
+)
+CALLBACK_BYTES = Histogram(
+    "slack_bridge_callback_payload_bytes",
+    "Size of LangGraph webhook callback bodies.",
+    buckets=tuple(2**n for n in range(10, 26, 2)),
+    registry=REGISTRY,
+)
+
+# Label lookups take a lock, so resolve each stage's histogram once.
+_STAGE_CHILDREN = {stage: STAGE_SECONDS.labels(stage) for stage in STAGES}
+# Seconds per stage of the task being profiled, shared with the asyncio tasks
+# it starts, which copy the context.
+_TASK_STAGES: ContextVar[dict[str, float] | None] = ContextVar(
+    "task_stages", default=None
+)
+
+
+def observe(stage: str, seconds: float) -> None:
+    _STAGE_CHILDREN[stage].observe(seconds)
+    if (stages := _TASK_STAGES.get()) is not None:
+        stages[stage] = stages.get(stage, 0) + seconds
+
+
+@contextmanager
+def task_stages() -> Iterator[dict[str, float]]:
+    """Collect the seconds spent in each stage within the block."""
+    stages: dict[str, float] = {}
+    token = _TASK_STAGES.set(stages)
+    try:
+        yield stages
+    finally:
+        _TASK_STAGES.reset(token)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """Record the time spent in the block, whether or not it raises."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+def langgraph_error(exc: Exception) -> None:
+    response = getattr(exc, "response", None)
+    status = getattr(response, "status_code", None)
+    LANGGRAPH_ERRORS.labels(str(status) if status else "error").inc()
+
+
+class _Stats(Protocol):
+    def stats(self) -> dict: ...
+
+
+class StatsCollector:
+    """Exports queue, Slack API, cache and HTTP pool statistics when scraped.
+
+    The numbers come from the components' own stats(), so collecting them
+    costs nothing between scrapes.
+    """
+
+    def __init__(
+        self,
+        queue: _Stats,
+        slack_client: _Stats,
+        caches: dict[str, _Stats],
+        pools: Callable[[], dict[str, dict | None]] | None = None,
+    ):
+        self.queue = queue
+        self.slack_client = slack_client
+        self.caches = caches
+        self.pools = pools
+
+    def collect(self):
+        queue = self.queue.stats()
+        depth = GaugeMetricFamily(
+            "slack_bridge_queue_depth",
+            "Tasks waiting per worker shard.",
+            labels=["shard"],
+        )
+        for shard, shard_depth in enumerate(queue["shard_depths"]):
+            depth.add_metric([str(shard)], shard_depth)
+        yield depth
+        yield GaugeMetricFamily(
+            "slack_bridge_queue_oldest_task_age_seconds",
+            "Age of the oldest queued task.",
+            value=queue["oldest_task_age_seconds"],
+        )
+        shed = CounterMetricFamily(
+            "slack_bridge_queue_shed_tasks",
+            "Tasks dropped or rejected because the queue was full.",
+            labels=["type", "reason"],
+        )
+        for reason in ("dropped", "rejected"):
+            for task_type, count in queue[reason].items():
+                shed.add_metric([task_type, reason], count)
+        yield shed
+
+        slack = self.slack_client.stats()
+        for key, name, doc in (
+            ("calls", "slack_api_calls", "Slack API calls made."),
+            ("rate_limited", "slack_api_rate_limited", "Slack 429 responses."),
+            ("errors", "slack_api_errors", "Failed Slack API calls."),
+            (
+                "wait_seconds",
+                "slack_api_wait_seconds",
+                "Time spent waiting for rate limits.",
+            ),
+        ):
+            family = CounterMetricFamily(name, doc, labels=["method"])
+            for method, value in slack[key].items():
+                family.add_metric([method], value)
+            yield family
+
+        hits = CounterMetricFamily(
+            "slack_bridge_cache_hits", "Cache hits.", labels=["cache"]
+        )
+        misses = CounterMetricFamily(
+            "slack_bridge_cache_misses", "Cache misses.", labels=["cache"]
+        )
+        size = GaugeMetricFamily(
+            "slack_bridge_cache_size", "Entries in each cache.", labels=["cache"]
+        )
+        ratio = GaugeMetricFamily(
+            "slack_bridge_cache_hit_ratio", "Cache hits per lookup.", labels=["cache"]
+        )
+        for name, cache in self.caches.items():
+            cache_stats = cache.stats()
+            hits.add_metric([name], cache_stats["hits"])
+            misses.add_metric([name], cache_stats["misses"])
+            size.add_metric([name], cache_stats["size"])
+            if cache_stats["hit_ratio"] is not None:
+                ratio.add_metric([name], cache_stats["hit_ratio"])
+        yield from (hits, misses, size, ratio)
+
+        if self.pools is None:
+            return
+        connections = GaugeMetricFamily(
+            "slack_bridge_http_pool_connections",
+            "Open HTTP connections per pool, in use or idle.",
+            labels=["pool", "state"],
+        )
+        waiting = GaugeMetricFamily(
+            "slack_bridge_http_pool_waiting",
+            "Requests waiting for a connection because the pool is full.",
+            labels=["pool"],
+        )
+        saturation = GaugeMetricFamily(
+            "slack_bridge_http_pool_saturation",
+            "Connections in use per pool size.",
+            labels=["pool"],
+        )
+        for name, pool in self.pools().items():
+            if pool is None:
+                continue
+            connections.add_metric([name, "in_use"], pool["in_use"])
+            connections.add_metric([name, "idle"], pool["idle"])
+            waiting.add_metric([name], pool["waiting"])
+            saturation.add_metric([name], pool["saturation"])
+        yield from (connections, waiting, saturation)
@@ -0,0 +1,47 @@
+import re
+
+# One alternation, tried at each position. Every branch starts with a literal
+# character so the regex engine can skip plain text quickly; constructs that
+# must start a line match the preceding "\n" instead of using "^". Code comes
+# first so nothing inside it is rewritten (fences may be indented, as in list
+# items), and bullets come before italics so a "* item" line is not read as
+# the start of an italic span.
+_TOKEN = re.compile(
+    r"\n(?P<fence>(?P<fence_indent>[ \t]*)```[^\n]*\n(?s:.*?)(?:^[ \t]*```[ \t]*$|\Z))"
+    r"|\n(?P<bullet>(?P<indent>[ \t]*)[-*][ \t]+)"
+    r"|`(?P<code>[^`\n]+)`"
+    r"|\[(?P<link_text>[^\]\n]+)\]\((?P<link_url>[^)\s]+)\)"
+    r"|\*\*\*(?P<bold_italic>[^*\s](?:[^*\n]*?[^*\s])?)\*\*\*"
+    r"|\*\*(?P<bold>[^*\n](?:[^\n]*?[^*\n])?)\*\*"
+    r"|\*(?<![*\w]\*)(?P<italic>[^*\s](?:[^*\n]*?[^*\s])?)\*(?![*\w])",
+    re.MULTILINE,
+)
+
+
+def _replace(match: re.Match) -> str:
+    kind = match.lastgroup
+    if kind == "fence_indent" or kind == "fence":
+        # Slack does not highlight code, so drop the language tag.
+        fence = match["fence"]
+        return f"\n{match['fence_indent']}```\n" + fence[fence.index("\n") + 1 :]
+    if kind == "indent" or kind == "bullet":
+        return f"\n{match['indent']}• "
+    if kind == "code":
+        return match.group()
+    if kind == "link_url":
+        return f"<{match['link_url']}|{to_mrkdwn(match['link_text'])}>"
+    if kind == "bold_italic":
+        return f"*_{to_mrkdwn(match['bold_italic'])}_*"
+    if kind == "bold":
+        return f"*{to_mrkdwn(match['bold'])}*"
+    return f"_{match['italic']}_"
+
+
+def to_mrkdwn(text: str) -> str:
+    """Convert Markdown links, bold, italics and bullets to Slack mrkdwn.
+
+    Fenced and inline code is left untouched, apart from dropping the language
+    tag from code fences.
+    """
+    # The leading newline lets the first line match line-start constructs.
+    return _TOKEN.sub(_replace, "\n" + text)[1:]
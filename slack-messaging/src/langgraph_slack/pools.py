@@ -0,0 +1,86 @@
+import aiohttp
+import httpx
+from langgraph_sdk import get_client
+from langgraph_sdk.client import LangGraphClient
+
+
+def slack_session(size: int, keepalive: float) -> aiohttp.ClientSession:
+    """A session for the Slack client to share, keeping connections open.
+
+    Without one, AsyncWebClient opens (and TLS-handshakes) a new connection for
+    every call. Must be created inside the running event loop.
+    """
+    return aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=size, keepalive_timeout=keepalive)
+    )
+
+
+def langgraph_client(
+    url: str | None,
+    size: int,
+    keepalive: float,
+    connect_timeout: float,
+    timeout: float,
+) -> LangGraphClient:
+    """get_client(), with a connection pool of `size` kept-alive connections."""
+    client = get_client(url=url)
+    http = client.http.client
+    if isinstance(http._transport, httpx.AsyncHTTPTransport):
+        # get_client does not take pool limits, so swap in a client that has
+        # them. Other transports (the in-process server) have no pool to size.
+        client.http.client = httpx.AsyncClient(
+            base_url=http.base_url,
+            headers=http.headers,
+            timeout=httpx.Timeout(
+                timeout, connect=connect_timeout, pool=connect_timeout
+            ),
+            transport=httpx.AsyncHTTPTransport(
+                retries=5,
+                limits=httpx.Limits(
+                    max_connections=size,
+                    max_keepalive_connections=size,
+                    keepalive_expiry=keepalive,
+                ),
+            ),
+        )
+    return client
+
+
+def _stats(size: int, in_use: int, idle: int, waiting: int) -> dict:
+    return {
+        "size": size,
+        "in_use": in_use,
+        "idle": idle,
+        "waiting": waiting,
+        "saturation": in_use / size if size else 0.0,
+    }
+
+
+def slack_pool_stats(session: aiohttp.ClientSession | None) -> dict | None:
+    """Connections of the Slack session in use, idle and waited for."""
+    if session is None or session.closed:
+        return None
+    # aiohttp has no public API for these counts.
+    connector = session.connector
+    return _stats(
+        connector.limit,
+        len(connector._acquired),
+        sum(len(conns) for conns in connector._conns.values()),
+        sum(len(waiters) for waiters in connector._waiters.values()),
+    )
+
+
+def langgraph_pool_stats(client: LangGraphClient) -> dict | None:
+    """Connections of the LangGraph client in use, idle and waited for."""
+    pool = getattr(client.http.client._transport, "_pool", None)
+    if pool is None:
+        return None
+    connections = pool.connections
+    idle = sum(connection.is_idle() for connection in connections)
+    # httpcore has no public count of queued requests.
+    return _stats(
+        pool._max_connections,
+        len(connections) - idle,
+        idle,
+        sum(request.is_queued() for request in pool._requests),
+    )
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator
+
+from langgraph_slack import metrics
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _await_stack(task: asyncio.Task) -> list[str]:
+    """Where a suspended task is waiting: its chain of awaiting coroutines."""
+    stack = []
+    awaitable = task.get_coro()
+    while awaitable is not None:
+        frame = getattr(awaitable, "cr_frame", None) or getattr(
+            awaitable, "ag_frame", None
+        )
+        if frame is None:
+            stack.append(f"await {type(awaitable).__name__}")
+            if not isinstance(awaitable, asyncio.Task):
+                break
+            # Follow into tasks awaited directly, e.g. shared lookups.
+            awaitable = awaitable.get_coro()
+            continue
+        stack.append(_label(frame))
+        awaitable = getattr(awaitable, "cr_await", None) or getattr(
+            awaitable, "ag_await", None
+        )
+    return stack
+
+
+def _running_stack(frame, top_code) -> list[str]:
+    """The call stack of the loop thread, from the task's coroutine down."""
+    stack = []
+    while frame is not None:
+        stack.append(_label(frame))
+        if frame.f_code is top_code:
+            break
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+class _Profile:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+
+
+class TaskProfiler:
+    """Samples the stacks of worker tasks and writes out the interesting ones.
+
+    A sampler thread looks at the event loop every `interval` seconds. A
+    profiled task that is running contributes the loop thread's call stack
+    (CPU work, e.g. regexes), and one that is suspended its chain of awaits
+    (what it is waiting on, e.g. conversations.replies or LangGraph). Every
+    `every`th task is written out, and so is any task that takes at least
+    `slow_seconds`; with a slow threshold, every task is sampled so that the
+    slow ones can be. Each written task gets a .folded file of collapsed stacks
+    (for flamegraph.pl, speedscope or inferno) and a .json file with its
+    stage breakdown. The oldest files are deleted to keep the directory under
+    max_bytes.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        every: int = 0,
+        slow_seconds: float = 0,
+        interval: float = 0.01,
+        max_bytes: int = 100 * 1024 * 1024,
+    ):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.every = every
+        self.slow_seconds = slow_seconds
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.tasks = 0
+        self.sampled = 0
+        self.written = 0
+        self._profiles: dict[asyncio.Task, _Profile] = {}
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread: int | None = None
+        self._sampler: threading.Thread | None = None
+        self._lock = threading.Lock()
+
+    @asynccontextmanager
+    async def profile(self, task: dict, waited: float = 0) -> AsyncIterator[None]:
+        """Profile the current asyncio task for the duration of the block."""
+        self.tasks += 1
+        selected = bool(self.every) and self.tasks % self.every == 0
+        if not (selected or self.slow_seconds):
+            yield
+            return
+        profile = _Profile(asyncio.current_task())
+        self._start()
+        with self._lock:
+            self._profiles[profile.task] = profile
+        started = time.perf_counter()
+        error = None
+        try:
+            with metrics.task_stages() as stages:
+                yield
+        except BaseException as exc:
+            error = repr(exc)
+            raise
+        finally:
+            with self._lock:
+                del self._profiles[profile.task]
+            self.sampled += 1
+            duration = time.perf_counter() - started
+            if selected or duration >= self.slow_seconds:
+                record = {
+                    "type": task["type"],
+                    "reason": "sampled" if selected else "slow",
+                    "started_at": time.time() - duration,
+                    "duration_seconds": round(duration, 6),
+                    "queue_wait_seconds": round(waited, 6),
+                    "stages": {
+                        stage: round(seconds, 6) for stage, seconds in stages.items()
+                    },
+                    "samples": profile.samples,
+                    "sample_interval_seconds": self.interval,
+                    "trace_id": (task.get("trace") or {}).get("trace_id"),
+                    "error": error,
+                }
+                asyncio.get_running_loop().run_in_executor(
+                    None, self._write, record, profile.stacks
+                )
+
+    def _start(self) -> None:
+        if self._sampler is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._sampler = threading.Thread(
+            target=self._sample, name="task-profiler", daemon=True
+        )
+        self._sampler.start()
+
+    def _sample(self) -> None:
+        while self._sampler is not None:
+            time.sleep(self.interval)
+            # Held while sampling, so a finished profile is never added to.
+            with self._lock:
+                if not self._profiles:
+                    continue
+                frame = sys._current_frames().get(self._loop_thread)
+                running = asyncio.current_task(self._loop)
+                for profile in self._profiles.values():
+                    try:
+                        if profile.task is running:
+                            code = profile.task.get_coro().cr_code
+                            stack = _running_stack(frame, code)
+                        else:
+                            stack = _await_stack(profile.task)
+                    except Exception:
+                        # The loop moved on while we looked; skip this sample.
+                        continue
+                    profile.stacks[";".join(stack)] += 1
+                    profile.samples += 1
+
+    def _write(self, record: dict, stacks: Counter[str]) -> None:
+        name = (
+            time.strftime("%Y%m%dT%H%M%S") + f"-{os.urandom(3).hex()}-{record['type']}"
+        )
+        try:
+            with open(self.directory / f"{name}.folded", "w") as f:
+                f.writelines(f"{stack} {count}\n" for stack, count in stacks.items())
+            with open(self.directory / f"{name}.json", "w") as f:
+                json.dump(record, f, indent=2)
+            self.written += 1
+            self._trim()
+        except OSError as exc:
+            LOGGER.warning(f"Failed to write task profile {name}: {exc}")
+
+    def _trim(self) -> None:
+        files = sorted(
+            (entry.stat().st_mtime, entry.stat().st_size, entry.path)
+            for entry in os.scandir(self.directory)
+            if entry.is_file()
+        )
+        total = sum(size for _, size, _ in files)
+        for _, size, path in files:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def close(self) -> None:
+        self._sampler = None
+
+    def stats(self) -> dict:
+        return {
+            "tasks": self.tasks,
+            "sampled": self.sampled,
+            "written": self.written,
+            "directory": str(self.directory),
+        }
@@ -0,0 +1,213 @@
+import asyncio
+import heapq
+import inspect
+import itertools
+import logging
+import time
+from collections import Counter
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+
+from langgraph_slack.cache import LRUCache
+
+LOGGER = logging.getLogger(__name__)
+
+# Lower values are served first when callers are waiting for the same bucket.
+HIGH = 0
+NORMAL = 1
+LOW = 2
+
+# Calls per minute for each Slack rate-limit tier:
+# https://api.slack.com/apis/rate-limits
+TIER_1, TIER_2, TIER_3, TIER_4 = 1, 20, 50, 100
+METHOD_RATES = {
+    "auth.test": TIER_4,
+    "chat.delete": TIER_3,
+    "chat.postEphemeral": TIER_4,
+    "chat.postMessage": 600,  # limited per channel instead, see below
+    "chat.update": TIER_3,
+    "conversations.replies": TIER_3,
+    "users.info": TIER_4,
+    "users.list": TIER_2,
+}
+DEFAULT_RATE = TIER_3
+
+# Methods that post into a channel share Slack's limit of about one message per
+# second per channel. Final answers and busy replies outrank streaming edits.
+CHANNEL_METHODS = {
+    "chat.postMessage": HIGH,
+    "chat.postEphemeral": HIGH,
+    "chat.delete": HIGH,
+    "chat.update": NORMAL,
+}
+CHANNEL_RATE = 1.0  # per second
+CHANNEL_BURST = 3
+
+
+class TokenBucket:
+    """A token bucket whose waiters are served in priority order.
+
+    Tokens refill at `rate` per second up to `capacity`. pause() empties the
+    bucket until a given time, e.g. to honour a Retry-After header.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._waiters: list[tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pump: asyncio.Task | None = None
+
+    def _refill(self, now: float) -> None:
+        if now <= self._updated:
+            return
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def _delay(self) -> float:
+        """Seconds until a token can be taken, or 0 if one is available now."""
+        now = time.monotonic()
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._tokens >= 1:
+            return 0.0
+        return (1 - self._tokens) / self.rate
+
+    async def acquire(self, priority: int = NORMAL) -> float:
+        """Take a token, waiting if needed. Returns the seconds spent waiting."""
+        if not self._waiters and self._delay() == 0:
+            self._tokens -= 1
+            return 0.0
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), waiter))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.ensure_future(self._serve())
+        await waiter
+        return time.monotonic() - started
+
+    async def _serve(self) -> None:
+        while self._waiters:
+            if delay := self._delay():
+                await asyncio.sleep(delay)
+                continue
+            _, _, waiter = heapq.heappop(self._waiters)
+            if not waiter.done():
+                self._tokens -= 1
+                waiter.set_result(None)
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        # Start refilling only once the pause is over.
+        self._tokens = 0
+        self._updated = self._paused_until
+
+
+class RateLimitedClient:
+    """Proxy for an AsyncWebClient that schedules calls within Slack's limits.
+
+    Every API method goes through a token bucket for its rate-limit tier, and
+    channel posts also go through a per-channel bucket. Rate-limited (429)
+    responses pause the method's bucket for the Retry-After period and are
+    retried up to max_retries times.
+    """
+
+    def __init__(
+        self,
+        client: AsyncWebClient,
+        rates: dict[str, float] | None = None,
+        max_retries: int = 3,
+        max_channels: int = 10000,
+    ):
+        self.client = client
+        self.rates = {**METHOD_RATES, **(rates or {})}
+        self.max_retries = max_retries
+        self._buckets: dict[str, TokenBucket] = {}
+        self._channel_buckets: LRUCache[str, TokenBucket] = LRUCache(max_channels)
+        self.calls: Counter[str] = Counter()
+        self.rate_limited: Counter[str] = Counter()
+        self.errors: Counter[str] = Counter()
+        self.wait_seconds: Counter[str] = Counter()
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.client, name)
+        if name.startswith("_") or not inspect.iscoroutinefunction(attr):
+            return attr
+        method = name.replace("_", ".")
+
+        async def call(*args, priority: int | None = None, **kwargs):
+            return await self._call(method, attr, priority, args, kwargs)
+
+        return call
+
+    def _bucket(self, method: str) -> TokenBucket:
+        if (bucket := self._buckets.get(method)) is None:
+            per_second = self.rates.get(method, DEFAULT_RATE) / 60
+            bucket = TokenBucket(per_second, capacity=max(1.0, per_second * 6))
+            self._buckets[method] = bucket
+        return bucket
+
+    def _channel_bucket(self, channel: str) -> TokenBucket:
+        if (bucket := self._channel_buckets.get(channel, count=False)) is None:
+            bucket = TokenBucket(CHANNEL_RATE, CHANNEL_BURST)
+            self._channel_buckets.set(channel, bucket)
+        return bucket
+
+    async def _call(self, method, func, priority, args, kwargs):
+        if priority is None:
+            priority = CHANNEL_METHODS.get(method, LOW)
+        channel = kwargs.get("channel") if method in CHANNEL_METHODS else None
+        for attempt in range(self.max_retries + 1):
+            waited = await self._bucket(method).acquire(priority)
+            if channel:
+                waited += await self._channel_bucket(channel).acquire(priority)
+            self.wait_seconds[method] += waited
+            self.calls[method] += 1
+            try:
+                return await func(*args, **kwargs)
+            except SlackApiError as exc:
+                if exc.response.status_code != 429:
+                    self.errors[method] += 1
+                    raise
+                self.rate_limited[method] += 1
+                headers = exc.response.headers
+                retry_after = float(
+                    headers.get("Retry-After") or headers.get("retry-after") or 1
+                )
+                self._bucket(method).pause(retry_after)
+                if channel:
+                    self._channel_bucket(channel).pause(retry_after)
+                if attempt == self.max_retries:
+                    self.errors[method] += 1
+                    raise
+                LOGGER.warning(
+                    f"Slack rate limited {method}, retrying in {retry_after}s "
+                    f"(attempt {attempt + 1}/{self.max_retries})"
+                )
+
+    def stats(self) -> dict:
+        return {
+            "calls": dict(self.calls),
+            "rate_limited": dict(self.rate_limited),
+            "errors": dict(self.errors),
+            "wait_seconds": {
+                method: round(seconds, 3)
+                for method, seconds in self.wait_seconds.items()
+            },
+            "queued": {
+                method: bucket.queued
+                for method, bucket in self._buckets.items()
+                if bucket.queued
+            },
+        }
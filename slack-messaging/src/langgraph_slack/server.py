@@ -1,26 +1,151 @@
 import asyncio
+import hmac
 import logging
 import re
 import json
+import time
 import uuid
+from urllib.parse import urlencode
 from typing import Awaitable, Callable, TypedDict
 from contextlib import asynccontextmanager
 
+import aiohttp
 from fastapi import FastAPI, Request
-from langgraph_sdk import get_client
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from slack_bolt.adapter.fastapi.async_handler import AsyncSlackRequestHandler
 from slack_bolt.async_app import AsyncApp
+from slack_bolt.authorization.async_authorize import AsyncInstallationStoreAuthorize
+from slack_bolt.context.async_context import AsyncBoltContext
+from slack_bolt.oauth.async_oauth_settings import AsyncOAuthSettings
+from slack_bolt.request.async_request import AsyncBoltRequest
+from slack_sdk.errors import SlackApiError
+from slack_sdk.oauth.installation_store.sqlite3 import SQLite3InstallationStore
+from slack_sdk.oauth.state_store.sqlite3 import SQLite3OAuthStateStore
+from slack_sdk.signature import SignatureVerifier
+from slack_sdk.web.async_client import AsyncWebClient
 
-from langgraph_slack import config
+from langgraph_slack import config, metrics, pools
+from langgraph_slack.answers import CACHED_ANSWER_EVENT, AnswerCache
+from langgraph_slack.attachments import AttachmentExtractor
+from langgraph_slack.backend import LOCAL, SQLiteBackend
+from langgraph_slack.cache import LRUCache
+from langgraph_slack.callbacks import CallbackReader, PayloadTooLarge
+from langgraph_slack.coalesce import MessageCoalescer
+from langgraph_slack.context import (
+    ContextBuilder,
+    ContextMessage,
+    estimate_tokens,
+    extractive_summary,
+    llm_summarizer,
+    render_message,
+)
+from langgraph_slack.dedup import EventDeduplicator
+from langgraph_slack.dispatcher import BLOCK
+from langgraph_slack.history import ThreadHistoryCache, is_bot_reply
+from langgraph_slack.journal import TaskJournal
+from langgraph_slack.logs import LogPipeline
+from langgraph_slack.mrkdwn import to_mrkdwn
+from langgraph_slack.profiling import TaskProfiler
+from langgraph_slack.ratelimit import RateLimitedClient
+from langgraph_slack.socket_mode import SocketModeRunner
+from langgraph_slack.tracing import TraceContext, Tracer
+from langgraph_slack.users import UserDirectory
+from langgraph_slack.workspaces import CombinedStats, Workspace, WorkspaceRegistry
 
 LOGGER = logging.getLogger(__name__)
-LANGGRAPH_CLIENT = get_client(url=config.LANGGRAPH_URL)
+# Takes over logging while the app runs; started in lifespan.
+LOG_PIPELINE = LogPipeline(
+    config.LOG_LEVEL,
+    json_format=config.LOG_FORMAT == "json",
+    sampling=config.LOG_SAMPLING,
+    redact=config.LOG_REDACT,
+    max_chars=config.LOG_MAX_FIELD_CHARS,
+    queue_size=config.LOG_QUEUE_SIZE,
+)
+LANGGRAPH_CLIENT = pools.langgraph_client(
+    config.LANGGRAPH_URL,
+    size=config.LANGGRAPH_POOL_SIZE,
+    keepalive=config.HTTP_KEEPALIVE,
+    connect_timeout=config.LANGGRAPH_CONNECT_TIMEOUT,
+    timeout=config.LANGGRAPH_TIMEOUT,
+)
 GRAPH_CONFIG = (
     json.loads(config.CONFIG) if isinstance(config.CONFIG, str) else config.CONFIG
 )
 
-USER_NAME_CACHE: dict[str, str] = {}
-TASK_QUEUE: asyncio.Queue = asyncio.Queue()
+BACKEND = (
+    SQLiteBackend(config.SHARED_STATE_PATH, lease_seconds=config.SHARED_QUEUE_LEASE)
+    if config.SHARED_STATE_PATH
+    else LOCAL
+)
+CONTEXT_BUILDER = (
+    ContextBuilder(
+        config.CONTEXT_TOKEN_BUDGET,
+        summarize=(
+            llm_summarizer(config.CONTEXT_SUMMARY_MODEL)
+            if config.CONTEXT_SUMMARY_MODEL
+            else extractive_summary
+        ),
+        segment_size=config.CONTEXT_SEGMENT_SIZE,
+        cache_size=config.CONTEXT_SUMMARY_CACHE_SIZE,
+        backend=BACKEND,
+    )
+    if config.CONTEXT_TOKEN_BUDGET
+    else None
+)
+# Newest Slack ts sent to each LangGraph thread. Earlier messages are already in
+# the thread's checkpoint, so only newer ones are sent as run input.
+FORWARDED_TS: LRUCache[str, str] | None = (
+    BACKEND.cache("forwarded_ts", config.FORWARDED_TS_CACHE_SIZE)
+    if config.DELTA_INPUT
+    else None
+)
+ANSWER_CACHE = (
+    AnswerCache(
+        config.ANSWER_CACHE_SIZE,
+        config.ANSWER_CACHE_TTL,
+        config.ANSWER_CACHE_SCOPE,
+        config.ASSISTANT_ID,
+        GRAPH_CONFIG,
+        backend=BACKEND,
+    )
+    if config.ANSWER_CACHE_TTL > 0
+    else None
+)
+TRACER = Tracer(config.TRACE_EXPORT_PATH)
+PROFILER = (
+    TaskProfiler(
+        config.PROFILE_DIR,
+        every=config.PROFILE_EVERY,
+        slow_seconds=config.PROFILE_SLOW_SECONDS,
+        interval=config.PROFILE_INTERVAL,
+        max_bytes=config.PROFILE_MAX_BYTES,
+    )
+    if config.PROFILE_DIR
+    else None
+)
+CALLBACK_READER = CallbackReader(config.CALLBACK_MAX_BYTES)
+EVENT_DEDUP = EventDeduplicator(
+    config.EVENT_DEDUP_SIZE, config.EVENT_DEDUP_TTL, backend=BACKEND
+)
+# Background tasks streaming replies into Slack, by LangGraph thread ID.
+STREAMS: dict[str, asyncio.Task] = {}
+TASK_JOURNAL = (
+    TaskJournal(
+        config.TASK_JOURNAL_PATH, flush_interval=config.TASK_JOURNAL_FLUSH_INTERVAL
+    )
+    # The shared queue is durable itself.
+    if config.TASK_JOURNAL_PATH and not config.SHARED_STATE_PATH
+    else None
+)
+TASK_QUEUE = BACKEND.task_queue(
+    config.WORKER_COUNT,
+    maxsize=config.QUEUE_MAXSIZE,
+    block_timeout=config.QUEUE_BLOCK_TIMEOUT,
+    on_drop=TASK_JOURNAL.ack if TASK_JOURNAL else None,
+    weights=config.QUEUE_WEIGHTS,
+)
 
 
 class SlackMessageData(TypedDict):
@@ -39,48 +164,193 @@ class SlackMessageData(TypedDict):
     channel_type: str
 
 
-async def worker():
-    LOGGER.info("Background worker started.")
+# Seconds a worker waits after the queue itself failed (e.g. a busy shared
+# database) before trying again.
+WORKER_ERROR_BACKOFF = 1.0
+
+
+async def worker(shard: int):
+    LOGGER.info(f"Background worker {shard} started.")
+    queue = TASK_QUEUE.shards[shard]
     while True:
         try:
-            task = await TASK_QUEUE.get()
-            if not task:
-                LOGGER.info("Worker received sentinel, exiting.")
-                break
+            task, waited = await queue.get()
+        except Exception as exc:
+            LOGGER.exception(f"Error taking a task in worker {shard}: {exc}")
+            await asyncio.sleep(WORKER_ERROR_BACKOFF)
+            continue
+        if not task:
+            LOGGER.info(f"Worker {shard} received sentinel, exiting.")
+            break
+
+        LOGGER.info(
+            "Worker %d got a %s task after %.3fs in queue",
+            shard,
+            task["type"],
+            waited,
+            extra={"shard": shard, "task_type": task["type"], "queue_wait": waited},
+        )
+        LOGGER.debug("Task: %s", task)
+        metrics.observe("queue_wait", waited)
+        if trace := task.get("trace"):
+            TRACER.start_span(
+                "queue", trace, start_ns=time.time_ns() - int(waited * 1e9)
+            ).end()
+        started = time.perf_counter()
+        try:
+            with TRACER.span(f"{task['type']}.process", trace, shard=shard):
+                if PROFILER:
+                    async with PROFILER.profile(task, waited):
+                        await _process_task(task)
+                else:
+                    await _process_task(task)
+        except Exception as exc:
+            metrics.TASKS.labels(task["type"], "error").inc()
+            LOGGER.exception(f"Error in worker {shard}: {exc}")
+        else:
+            metrics.TASKS.labels(task["type"], "ok").inc()
+            if task["type"] == "callback":
+                metrics.observe(
+                    "callback_to_post", waited + time.perf_counter() - started
+                )
+        # Failed tasks are acked too; only tasks interrupted by a shutdown
+        # (cancelled mid-flight) are left in the journal to be replayed.
+        try:
+            await TASK_QUEUE.done(task)
+            if TASK_JOURNAL:
+                TASK_JOURNAL.ack(task)
+        except Exception as exc:
+            LOGGER.exception(f"Error finishing a task in worker {shard}: {exc}")
+            await asyncio.sleep(WORKER_ERROR_BACKOFF)
+
+
+# Task priorities: lower is served first.
+PRIORITY_CALLBACK = 0  # a finished answer, only waiting to be posted
+PRIORITY_DM = 1
+PRIORITY_CHANNEL = 2
+
+
+def _task_schedule(task: dict) -> tuple[int, tuple[str, ...]]:
+    """The task's priority and the fair-queuing flows (channel, user) it is in."""
+    event = task["event"]
+    if task["type"] == "callback":
+        metadata = event.get("metadata") or {}
+        flows = (metadata.get("channel"), metadata.get("slack_user_id"))
+        priority = PRIORITY_CALLBACK
+    else:
+        flows = (event.get("channel"), event.get("user"))
+        priority = PRIORITY_DM if _is_dm(event) else PRIORITY_CHANNEL
+    return priority, tuple(flow for flow in flows if flow)
 
-            LOGGER.info(f"Worker got a new task: {task}")
-            await _process_task(task)
+
+def _task_thread_id(task: dict) -> str:
+    event = task["event"]
+    if task["type"] == "callback":
+        return event["thread_id"]
+    return _get_thread_id(event.get("thread_ts") or event["ts"], event["channel"])
+
+
+async def _enqueue(task: dict) -> bool:
+    """Route a task to the worker that owns its LangGraph thread.
+
+    Returns False if the queue was full and the task was rejected.
+    """
+    if TASK_JOURNAL:
+        try:
+            await TASK_JOURNAL.append(task)
         except Exception as exc:
-            LOGGER.exception(f"Error in worker: {exc}")
-        finally:
-            TASK_QUEUE.task_done()
+            LOGGER.warning(f"Queueing {task['type']} task without journaling: {exc}")
+    policy = config.QUEUE_POLICIES[task["type"]]
+    accepted = await TASK_QUEUE.put(
+        _task_thread_id(task), task, policy, *_task_schedule(task)
+    )
+    if not accepted and TASK_JOURNAL:
+        TASK_JOURNAL.ack(task)
+    return accepted
+
+
+async def _replay_journal(tasks: list[dict]):
+    """Requeue tasks left unfinished by the previous process."""
+    for task in tasks:
+        if not await TASK_QUEUE.put(
+            _task_thread_id(task), task, BLOCK, *_task_schedule(task)
+        ):
+            LOGGER.warning(
+                f"Could not replay journaled {task['type']} task; "
+                "it will be retried on next startup"
+            )
+    LOGGER.info(f"Replayed {len(tasks)} journaled tasks")
+
+
+async def _reply_busy(event: SlackMessageData):
+    """Tell the user we shed their message, visible only to them."""
+    try:
+        if (workspace := await _event_workspace(event)) is None:
+            return
+        await workspace.client.chat_postEphemeral(
+            channel=event["channel"],
+            user=event["user"],
+            thread_ts=event.get("thread_ts"),
+            text=config.BUSY_MESSAGE,
+        )
+    except Exception as exc:
+        LOGGER.warning(f"Failed to send busy reply to {event['user']}: {exc}")
 
 
 async def _process_task(task: dict):
     event = task["event"]
     event_type = task["type"]
+    trace: TraceContext | None = task.get("trace")
+    workspace = await _task_workspace(task)
+    if workspace is None:
+        LOGGER.warning(f"Dropping {event_type} task of a team without installation")
+        return
     if event_type == "slack_message":
         thread_id = _get_thread_id(
             event.get("thread_ts") or event["ts"], event["channel"]
         )
         channel_id = event["channel"]
-        # This will connect to the loopback endpoint if not provided.
-        webhook = f"{config.DEPLOYMENT_URL}/callbacks/{thread_id}"
+        # This will connect to the loopback endpoint if not provided. Where to
+        # reply goes in the URL too, so that a callback too large to read can
+        # still be answered.
+        reply_to = {
+            "channel": channel_id,
+            "user": event["user"],
+            "thread_ts": event.get("thread_ts") or event["ts"],
+            "context_team_id": event.get("context_team_id"),
+            "context_enterprise_id": event.get("context_enterprise_id"),
+        }
+        webhook = f"{config.DEPLOYMENT_URL}/callbacks/{thread_id}?" + urlencode(
+            {key: value for key, value in reply_to.items() if value}
+        )
 
-        if (await _is_mention(event)) or _is_dm(event):
-            text_with_names = await _build_contextual_message(event)
-        else:
-            LOGGER.info("Skipping non-mention message")
+        if not ((await _is_mention(event, workspace)) or _is_dm(event)):
+            LOGGER.info("Skipping non-mention message", extra={"channel": channel_id})
             return
+        answer_key = None
+        if (
+            ANSWER_CACHE
+            and (event.get("thread_ts") or event["ts"]) == event["ts"]
+            and not event.get("files")
+        ):
+            # Only questions that start a thread, without files: the answers to
+            # others depend on the thread or the files.
+            answer_key = ANSWER_CACHE.key(event["text"], channel_id, workspace.team_id)
+            if answer_key and (answer := ANSWER_CACHE.get(answer_key)) is not None:
+                await _post_cached_answer(workspace, event, answer, trace)
+                return
+        try:
+            text_with_names, newest_ts = await _build_contextual_message(
+                event, workspace
+            )
+        except SlackApiError as exc:
+            if exc.response.status_code == 429:
+                # Still rate limited after every retry: no answer rather than
+                # one built from part of the thread.
+                await _reply_busy(event)
+            raise
 
-        LOGGER.info(
-            f"[{channel_id}].[{thread_id}] sending message to LangGraph: "
-            f"with webhook {webhook}: {text_with_names}"
-        )
-
-        result = await LANGGRAPH_CLIENT.runs.create(
-            thread_id=thread_id,
-            assistant_id=config.ASSISTANT_ID,
+        run_kwargs = dict(
             input={
                 "messages": [
                     {
@@ -93,22 +363,92 @@ async def _process_task(task: dict):
             metadata={
                 "event": "slack",
                 "slack_event_type": "message",
-                "bot_user_id": config.BOT_USER_ID,
+                "bot_user_id": workspace.bot_user_id,
                 "slack_user_id": event["user"],
+                # Returned in the webhook callback, to reply in the same workspace.
+                "slack_team_id": event.get("context_team_id"),
+                "slack_enterprise_id": event.get("context_enterprise_id"),
                 "channel_id": channel_id,
                 "channel": channel_id,
                 "thread_ts": event.get("thread_ts"),
                 "event_ts": event["ts"],
                 "channel_type": event.get("channel_type"),
+                # Returned in the webhook callback, to cache the answer.
+                **({"answer_cache_key": answer_key} if answer_key else {}),
+                # Returned in the webhook callback, to continue the trace.
+                **(
+                    {
+                        "trace_id": trace["trace_id"],
+                        "trace_span_id": trace["span_id"],
+                        "trace_start_ns": trace["start_ns"],
+                        "run_started_ns": time.time_ns(),
+                    }
+                    if trace
+                    else {}
+                ),
             },
             multitask_strategy="interrupt",
             if_not_exists="create",
-            webhook=webhook,
         )
-        LOGGER.info(f"LangGraph run: {result}")
+
+        if config.STREAM_REPLIES:
+            LOGGER.info(
+                "[%s].[%s] streaming message to LangGraph (%d chars)",
+                channel_id,
+                thread_id,
+                len(text_with_names),
+                extra={"channel": channel_id, "thread_id": thread_id},
+            )
+            LOGGER.debug("Message to LangGraph: %s", text_with_names)
+            _start_stream(
+                workspace,
+                thread_id,
+                channel_id,
+                event.get("thread_ts") or event["ts"],
+                run_kwargs,
+                trace,
+                newest_ts,
+            )
+            return
+
+        LOGGER.info(
+            "[%s].[%s] sending message to LangGraph (%d chars) with webhook %s",
+            channel_id,
+            thread_id,
+            len(text_with_names),
+            webhook,
+            extra={"channel": channel_id, "thread_id": thread_id},
+        )
+        LOGGER.debug("Message to LangGraph: %s", text_with_names)
+
+        try:
+            with metrics.timed("runs_create"):
+                result = await LANGGRAPH_CLIENT.runs.create(
+                    thread_id=thread_id,
+                    assistant_id=config.ASSISTANT_ID,
+                    webhook=webhook,
+                    **run_kwargs,
+                )
+        except Exception as exc:
+            metrics.langgraph_error(exc)
+            raise
+        if FORWARDED_TS is not None:
+            FORWARDED_TS.set(thread_id, newest_ts)
+        LOGGER.info(
+            "[%s].[%s] started LangGraph run %s",
+            channel_id,
+            thread_id,
+            result["run_id"],
+            extra={"thread_id": thread_id, "run_id": result["run_id"]},
+        )
+        LOGGER.debug("LangGraph run: %s", result)
 
     elif event_type == "callback":
-        LOGGER.info(f"Processing LangGraph callback: {event['thread_id']}")
+        LOGGER.info(
+            "Processing LangGraph callback: %s",
+            event["thread_id"],
+            extra={"thread_id": event["thread_id"]},
+        )
         state_values = event["values"]
         response_message = state_values["messages"][-1]
         thread_ts = event["metadata"].get("thread_ts") or event["metadata"].get(
@@ -120,59 +460,605 @@ async def _process_task(task: dict):
                 "Channel ID not found in event metadata and not set in environment"
             )
 
-        await APP_HANDLER.app.client.chat_postMessage(
-            channel=channel_id,
-            thread_ts=thread_ts,
-            text=_clean_markdown(_get_text(response_message["content"])),
-            metadata={
-                "event_type": "webhook",
-                "event_payload": {"thread_id": event["thread_id"]},
-            },
-        )
+        with metrics.timed("callback_post"):
+            response = await workspace.client.chat_postMessage(
+                channel=channel_id,
+                thread_ts=thread_ts,
+                text=to_mrkdwn(_get_text(response_message["content"])),
+                metadata={
+                    "event_type": "webhook",
+                    "event_payload": {"thread_id": event["thread_id"]},
+                },
+            )
+        if workspace.thread_history and thread_ts and response.get("message"):
+            workspace.thread_history.add_message(
+                channel_id, thread_ts, response["message"]
+            )
+        if (
+            ANSWER_CACHE
+            and (answer_key := event["metadata"].get("answer_cache_key"))
+            and event.get("status") == "success"
+        ):
+            ANSWER_CACHE.set(answer_key, _get_text(response_message["content"]))
+        if trace:
+            TRACER.end_trace(
+                "slack.mention_to_reply", trace, channel=channel_id, streamed=False
+            )
         LOGGER.info(
-            f"[{channel_id}].[{thread_ts}] sent message to Slack for callback {event['thread_id']}"
+            "[%s].[%s] sent message to Slack for callback %s",
+            channel_id,
+            thread_ts,
+            event["thread_id"],
+            extra={"channel": channel_id, "thread_id": event["thread_id"]},
         )
     else:
         raise ValueError(f"Unknown event type: {event_type}")
 
 
-async def handle_message(event: SlackMessageData, say: Callable, ack: Callable):
-    LOGGER.info("Enqueuing handle_message task...")
+async def _post_cached_answer(
+    workspace: Workspace,
+    event: SlackMessageData,
+    answer: str,
+    trace: TraceContext | None,
+):
+    """Reply to a question with the answer LangGraph gave it before."""
+    channel_id = event["channel"]
+    metadata = {"event_type": CACHED_ANSWER_EVENT, "event_payload": {}}
+    with metrics.timed("callback_post"):
+        response = await workspace.client.chat_postMessage(
+            channel=channel_id,
+            thread_ts=event["ts"],
+            text=to_mrkdwn(answer),
+            metadata=metadata,
+        )
+    if workspace.thread_history and response.get("message"):
+        workspace.thread_history.add_message(
+            channel_id, event["ts"], {**response["message"], "metadata": metadata}
+        )
+    if trace:
+        TRACER.end_trace(
+            "slack.mention_to_reply", trace, channel=channel_id, cached=True
+        )
+    LOGGER.info(
+        "[%s].[%s] answered from the answer cache",
+        channel_id,
+        event["ts"],
+        extra={"channel": channel_id},
+    )
+
+
+def _start_stream(
+    workspace: Workspace,
+    thread_id: str,
+    channel_id: str,
+    thread_ts: str,
+    run_kwargs: dict,
+    trace: TraceContext | None = None,
+    newest_ts: str | None = None,
+):
+    """Stream a run's reply into Slack in the background.
+
+    The run is streamed outside the worker so a long answer does not hold up
+    other threads on the same worker. A newer message in the same thread
+    interrupts the run, so its stream replaces the previous one. The thread's
+    forwarded cursor moves to newest_ts once LangGraph has accepted the run.
+    """
+    if previous := STREAMS.get(thread_id):
+        previous.cancel()
+    stream = asyncio.ensure_future(
+        _timed_stream_reply(
+            workspace, thread_id, channel_id, thread_ts, run_kwargs, trace, newest_ts
+        )
+    )
+    STREAMS[thread_id] = stream
+
+    def _done(task: asyncio.Task):
+        if STREAMS.get(thread_id) is task:
+            del STREAMS[thread_id]
+        if not task.cancelled() and (exc := task.exception()):
+            LOGGER.error(f"[{channel_id}].[{thread_ts}] streaming failed: {exc}")
+
+    stream.add_done_callback(_done)
+
+
+async def _timed_stream_reply(
+    workspace: Workspace,
+    thread_id: str,
+    channel_id: str,
+    thread_ts: str,
+    run_kwargs: dict,
+    trace: TraceContext | None,
+    newest_ts: str | None = None,
+):
+    started = time.perf_counter()
+    with TRACER.span("langgraph.stream", trace, thread_id=thread_id):
+        await _stream_reply(
+            workspace, thread_id, channel_id, thread_ts, run_kwargs, newest_ts
+        )
+    metrics.observe("stream_reply", time.perf_counter() - started)
+    if trace:
+        TRACER.end_trace(
+            "slack.mention_to_reply", trace, channel=channel_id, streamed=True
+        )
+
+
+async def _stream_reply(
+    workspace: Workspace,
+    thread_id: str,
+    channel_id: str,
+    thread_ts: str,
+    run_kwargs: dict,
+    newest_ts: str | None = None,
+):
+    """Post a placeholder and edit it as the run streams its answer."""
+    client = workspace.client
+    placeholder = await client.chat_postMessage(
+        channel=channel_id, thread_ts=thread_ts, text=config.STREAM_PLACEHOLDER
+    )
+    message_ts = placeholder["ts"]
+    text = posted = ""
+    last_update = 0.0
+    accepted = False
+    error = None
+    # Whether the answer's last message was streamed in full.
+    complete = False
+    try:
+        async for part in LANGGRAPH_CLIENT.runs.stream(
+            thread_id,
+            config.ASSISTANT_ID,
+            stream_mode="messages",
+            **run_kwargs,
+        ):
+            if not accepted and part.event != "error":
+                # The run exists, so LangGraph has the messages up to newest_ts;
+                # like after runs.create, later deltas start from there.
+                accepted = True
+                if FORWARDED_TS is not None:
+                    FORWARDED_TS.set(thread_id, newest_ts)
+            if part.event == "error":
+                error = RuntimeError(f"LangGraph run failed: {part.data}")
+                break
+            if part.event not in ("messages/partial", "messages/complete"):
+                continue
+            message = part.data[-1] if part.data else {}
+            if message.get("type") not in ("ai", "AIMessageChunk"):
+                continue
+            text = _get_text(message.get("content") or "")
+            complete = part.event == "messages/complete"
+            # chat.update is rate limited, so only send the latest text every
+            # STREAM_UPDATE_INTERVAL seconds.
+            now = time.monotonic()
+            if (
+                text
+                and text != posted
+                and now - last_update >= config.STREAM_UPDATE_INTERVAL
+            ):
+                await client.chat_update(
+                    channel=channel_id, ts=message_ts, text=to_mrkdwn(text)
+                )
+                posted, last_update = text, now
+    except asyncio.CancelledError:
+        LOGGER.info("[%s].[%s] stream interrupted", channel_id, thread_ts)
+        if not posted:
+            await client.chat_delete(channel=channel_id, ts=message_ts)
+        raise
+    except Exception as exc:
+        metrics.langgraph_error(exc)
+        await _fail_stream(client, channel_id, message_ts, posted)
+        raise
+    if error is not None:
+        metrics.langgraph_error(error)
+        await _fail_stream(client, channel_id, message_ts, posted)
+        raise error
+    if not text:
+        LOGGER.warning(f"[{channel_id}].[{thread_ts}] run ended without an answer")
+        await client.chat_delete(channel=channel_id, ts=message_ts)
+        return
+    if text != posted:
+        await client.chat_update(
+            channel=channel_id, ts=message_ts, text=to_mrkdwn(text)
+        )
+    if workspace.thread_history and placeholder.get("message"):
+        workspace.thread_history.add_message(
+            channel_id, thread_ts, {**placeholder["message"], "text": text}
+        )
+    # Like the webhook path, which caches only runs whose status is success:
+    # here the stream ended without an error and the answer is complete.
+    if (
+        ANSWER_CACHE
+        and complete
+        and (answer_key := run_kwargs["metadata"].get("answer_cache_key"))
+    ):
+        ANSWER_CACHE.set(answer_key, text)
+    LOGGER.info(
+        "[%s].[%s] streamed reply for thread %s",
+        channel_id,
+        thread_ts,
+        thread_id,
+        extra={"channel": channel_id, "thread_id": thread_id},
+    )
+
+
+async def _fail_stream(
+    client: RateLimitedClient, channel_id: str, message_ts: str, posted: str
+):
+    """Turn a failed run's reply into an error message, keeping what was
+    already streamed."""
+    text = config.STREAM_ERROR_MESSAGE
+    if posted:
+        text = f"{to_mrkdwn(posted)}\n\n{text}"
+    try:
+        await client.chat_update(channel=channel_id, ts=message_ts, text=text)
+    except Exception as exc:
+        LOGGER.warning(f"Failed to mark streamed reply {message_ts} failed: {exc}")
+
+
+async def handle_message(
+    event: SlackMessageData, say: Callable, ack: Callable, context: AsyncBoltContext
+):
+    LOGGER.debug("Enqueuing handle_message task...")
+    # The same message can arrive again under a new event_id, e.g. when Slack
+    # gives up on a delivery and sends it afresh.
+    if EVENT_DEDUP.check_and_add(
+        "client_msg_id",
+        client_msg_id=event.get("client_msg_id"),
+    ):
+        LOGGER.info("Ignoring duplicate message %s", event.get("client_msg_id"))
+        return
+    # The workspace the event was delivered to, which is not always the
+    # poster's (event["team"]), e.g. in channels shared between organizations.
+    event["context_team_id"] = context.team_id
+    event["context_enterprise_id"] = context.enterprise_id
+    workspace = await _event_workspace(event)
+    if workspace is None:
+        LOGGER.warning(f"Ignoring message to team {context.team_id}: not installed")
+        return
+    if workspace.thread_history:
+        workspace.thread_history.add_event(event)
     nouser = not event.get("user")
-    ismention = await _is_mention(event)
-    userisbot = event.get("bot_id") == config.BOT_USER_ID
+    ismention = await _is_mention(event, workspace)
+    userisbot = event.get("bot_id") == workspace.bot_user_id
     isdm = _is_dm(event)
     if nouser or userisbot or not (ismention or isdm):
-        LOGGER.info(f"Ignoring message not directed at the bot: {event}")
+        LOGGER.info(
+            "Ignoring message %s in %s not directed at the bot",
+            event.get("ts"),
+            event.get("channel"),
+        )
+        LOGGER.debug("Ignored event: %s", event)
         return
 
-    TASK_QUEUE.put_nowait({"type": "slack_message", "event": event})
+    if COALESCER:
+        COALESCER.add(_task_thread_id({"type": "slack_message", "event": event}), event)
+    else:
+        await _enqueue_message([event])
     await ack()
 
 
+async def _enqueue_message(events: list[SlackMessageData]):
+    """Queue a burst of messages from one thread as a single task.
+
+    Only the latest message is queued: the earlier ones are part of its thread
+    history, so they end up in the same contextual message.
+    """
+    event = events[-1]
+    # The trace starts when the user posted the message, so its root span
+    # covers the whole wait for a reply, including Slack's delivery.
+    trace = TRACER.new_trace(start_ns=int(float(event["ts"]) * 1e9))
+    TRACER.start_span(
+        "slack.deliver", trace, start_ns=trace["start_ns"], messages=len(events)
+    ).end()
+    if not await _enqueue({"type": "slack_message", "event": event, "trace": trace}):
+        await _reply_busy(event)
+
+
 async def just_ack(ack: Callable[..., Awaitable], event):
-    LOGGER.info(f"Acknowledging {event.get('type')} event")
+    LOGGER.info("Acknowledging %s event", event.get("type"))
     await ack()
 
 
-APP_HANDLER = AsyncSlackRequestHandler(AsyncApp(logger=LOGGER))
+INSTALLATION_STORE = (
+    SQLite3InstallationStore(
+        database=config.INSTALLATION_STORE_PATH, client_id=config.CLIENT_ID
+    )
+    if config.MULTI_WORKSPACE
+    else None
+)
+APP_HANDLER = AsyncSlackRequestHandler(
+    AsyncApp(
+        logger=LOGGER,
+        **(
+            {"client": AsyncWebClient(config.BOT_TOKEN, base_url=config.SLACK_API_URL)}
+            if config.SLACK_API_URL
+            else {}
+        ),
+        **(
+            {
+                "oauth_settings": AsyncOAuthSettings(
+                    client_id=config.CLIENT_ID,
+                    client_secret=config.CLIENT_SECRET,
+                    scopes=config.OAUTH_SCOPES,
+                    installation_store=INSTALLATION_STORE,
+                    installation_store_bot_only=True,
+                    state_store=SQLite3OAuthStateStore(
+                        database=config.INSTALLATION_STORE_PATH,
+                        expiration_seconds=600,
+                    ),
+                ),
+                # Without the cache, every event costs an auth.test call.
+                "authorize": AsyncInstallationStoreAuthorize(
+                    installation_store=INSTALLATION_STORE,
+                    client_id=config.CLIENT_ID,
+                    client_secret=config.CLIENT_SECRET,
+                    logger=LOGGER,
+                    bot_only=True,
+                    cache_enabled=True,
+                ),
+                "installation_store_bot_only": True,
+            }
+            if INSTALLATION_STORE
+            else {}
+        ),
+    )
+)
+# Without a signing secret (e.g. Socket Mode only), HTTP events go to Bolt as is.
+SIGNATURE_VERIFIER = (
+    SignatureVerifier(config.SIGNING_SECRET) if config.SIGNING_SECRET else None
+)
+# Shared by the Slack clients of every workspace; opened in lifespan.
+SLACK_SESSION: aiohttp.ClientSession | None = None
+
+
+def _new_workspace(
+    team_id: str | None,
+    token: str | None,
+    bot_user_id: str | None,
+    expires_at: float | None = None,
+) -> Workspace:
+    # The bridge's own calls go through a client of their own. Bolt deep-copies
+    # its client for lazy listeners, so it cannot hold the session.
+    client = RateLimitedClient(
+        AsyncWebClient(
+            token, base_url=APP_HANDLER.app.client.base_url, session=SLACK_SESSION
+        ),
+        rates=json.loads(config.SLACK_RATE_LIMITS),
+        max_retries=config.SLACK_MAX_RETRIES,
+    )
+    users = UserDirectory(
+        client,
+        maxsize=config.USER_CACHE_SIZE,
+        ttl=config.USER_CACHE_TTL,
+        backend=BACKEND,
+    )
+    if team_id and config.USER_DIRECTORY_WARMUP:
+        asyncio.ensure_future(users.warm_up())
+    return Workspace(
+        team_id,
+        bot_user_id,
+        client,
+        users,
+        (
+            ThreadHistoryCache(config.THREAD_HISTORY_CACHE_SIZE, backend=BACKEND)
+            if config.THREAD_HISTORY_CACHE_SIZE
+            else None
+        ),
+        expires_at=expires_at,
+    )
+
+
+WORKSPACES = (
+    WorkspaceRegistry(
+        _new_workspace,
+        installation_store=INSTALLATION_STORE,
+        maxsize=config.WORKSPACE_CACHE_SIZE,
+    )
+    if INSTALLATION_STORE
+    else WorkspaceRegistry(
+        _new_workspace,
+        default=_new_workspace(None, config.BOT_TOKEN, config.BOT_USER_ID),
+    )
+)
+# Totals over the active workspaces.
+SLACK_API_STATS = CombinedStats(
+    lambda: (workspace.client for workspace in WORKSPACES),
+    empty={"calls": {}, "rate_limited": {}, "errors": {}, "wait_seconds": {}},
+)
+_CACHE_EMPTY = {"size": 0, "maxsize": 0, "hits": 0, "misses": 0, "hit_ratio": None}
+USER_STATS = CombinedStats(
+    lambda: (workspace.users for workspace in WORKSPACES), empty=_CACHE_EMPTY
+)
+THREAD_HISTORY_STATS = (
+    CombinedStats(
+        lambda: (workspace.thread_history for workspace in WORKSPACES),
+        empty=_CACHE_EMPTY,
+    )
+    if config.THREAD_HISTORY_CACHE_SIZE
+    else None
+)
+ATTACHMENTS = None
+if config.ATTACHMENTS:
+    try:
+        ATTACHMENTS = AttachmentExtractor(
+            config.DOCUMENT_READER_PATH,
+            concurrency=config.ATTACHMENT_CONCURRENCY,
+            processes=config.ATTACHMENT_PROCESSES,
+            max_bytes=config.ATTACHMENT_MAX_BYTES,
+            max_chars=config.ATTACHMENT_MAX_CHARS,
+            timeout=config.ATTACHMENT_TIMEOUT,
+            cache_size=config.ATTACHMENT_CACHE_SIZE,
+            backend=BACKEND,
+        )
+    except Exception as exc:
+        LOGGER.warning(
+            f"Attachments disabled: cannot load DocumentReader from "
+            f"{config.DOCUMENT_READER_PATH}: {exc!r}"
+        )
+SOCKET_MODE = (
+    SocketModeRunner(
+        config.APP_TOKEN,
+        lambda envelope: _handle_envelope(envelope),
+        base_url=APP_HANDLER.app.client.base_url,
+    )
+    if config.APP_TOKEN
+    else None
+)
+COALESCER = (
+    MessageCoalescer(config.COALESCE_WINDOW, config.COALESCE_MAX_WAIT, _enqueue_message)
+    if config.COALESCE_WINDOW > 0
+    else None
+)
+WARM_UP_TIMEOUT = 10
 MENTION_REGEX = re.compile(r"<@([A-Z0-9]+)>")
-USER_ID_PATTERN = re.compile(rf"<@{config.BOT_USER_ID}>")
+metrics.REGISTRY.register(
+    metrics.StatsCollector(
+        TASK_QUEUE,
+        SLACK_API_STATS,
+        caches={
+            name: cache
+            for name, cache in (
+                ("thread_history", THREAD_HISTORY_STATS),
+                ("users", USER_STATS),
+                ("context_summaries", CONTEXT_BUILDER),
+                ("forwarded_cursors", FORWARDED_TS),
+                ("answers", ANSWER_CACHE),
+                ("attachments", ATTACHMENTS),
+            )
+            if cache is not None
+        },
+        pools=lambda: _pool_stats(),
+    )
+)
+
+
+async def handle_uninstall(ack: Callable[..., Awaitable], context: AsyncBoltContext):
+    """Forget a workspace that uninstalled the app."""
+    await ack()
+    LOGGER.info(f"App uninstalled from team {context.team_id}")
+    await INSTALLATION_STORE.async_delete_all(
+        enterprise_id=context.enterprise_id, team_id=context.team_id
+    )
+    WORKSPACES.evict(context.team_id, context.enterprise_id)
+
+
 APP_HANDLER.app.event("message")(ack=just_ack, lazy=[handle_message])
 APP_HANDLER.app.event("app_mention")(
     ack=just_ack,
     lazy=[],
 )
+if INSTALLATION_STORE:
+    APP_HANDLER.app.event("app_uninstalled")(handle_uninstall)
+
+
+async def _drain(name: str, tasks: list[asyncio.Task], deadline: float):
+    """Wait for tasks until the loop time reaches deadline, then cancel them."""
+    if not tasks:
+        return
+    timeout = max(deadline - asyncio.get_running_loop().time(), 0)
+    _, unfinished = await asyncio.wait(tasks, timeout=timeout)
+    if unfinished:
+        LOGGER.warning(
+            f"{len(unfinished)} {name} did not drain within "
+            f"{config.SHUTDOWN_DRAIN_TIMEOUT}s, cancelling them"
+        )
+        for task in unfinished:
+            task.cancel()
+        await asyncio.gather(*unfinished, return_exceptions=True)
+
+
+async def _resolve_bot_user_id():
+    # Installations come with the bot's user ID; only a bare token needs this.
+    if WORKSPACES.default:
+        config.BOT_USER_ID = await WORKSPACES.default.resolve_bot_user_id()
+
+
+async def _warm_up():
+    """Resolve the bot identity and open connections to Slack and LangGraph.
+
+    Failures are only logged; the first requests then pay for the setup.
+    """
+    started = time.perf_counter()
+    if WORKSPACES.default:
+        slack_calls = [
+            WORKSPACES.default.client.auth_test()
+            for _ in range(config.WARM_CONNECTIONS)
+        ]
+    else:
+        # Workspaces are loaded on demand, but api.test needs no token.
+        client = AsyncWebClient(
+            base_url=APP_HANDLER.app.client.base_url, session=SLACK_SESSION
+        )
+        slack_calls = [client.api_test() for _ in range(config.WARM_CONNECTIONS)]
+    warm_up = asyncio.gather(
+        _resolve_bot_user_id(),
+        *slack_calls,
+        *(
+            LANGGRAPH_CLIENT.http.client.get("/ok")
+            for _ in range(config.WARM_CONNECTIONS)
+        ),
+        return_exceptions=True,
+    )
+    try:
+        results = await asyncio.wait_for(warm_up, WARM_UP_TIMEOUT)
+    except asyncio.TimeoutError:
+        LOGGER.warning(f"Warm-up did not finish within {WARM_UP_TIMEOUT}s")
+        return
+    errors = [result for result in results if isinstance(result, Exception)]
+    if errors:
+        LOGGER.warning(f"Warm-up failed for {len(errors)} requests: {errors[0]!r}")
+    LOGGER.info(f"Warmed up connections in {time.perf_counter() - started:.2f}s")
+
+
+def _pool_stats() -> dict[str, dict | None]:
+    return {
+        "slack": pools.slack_pool_stats(SLACK_SESSION),
+        "langgraph": pools.langgraph_pool_stats(LANGGRAPH_CLIENT),
+    }
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    LOGGER.info("App is starting up. Creating background worker...")
+    global SLACK_SESSION
+    LOG_PIPELINE.start()
+    SLACK_SESSION = pools.slack_session(config.SLACK_POOL_SIZE, config.HTTP_KEEPALIVE)
+    for workspace in WORKSPACES:
+        workspace.client.client.session = SLACK_SESSION
     loop = asyncio.get_running_loop()
-    loop.create_task(worker())
+    # In the background, so a slow Slack or LangGraph does not hold up startup;
+    # requests that arrive first pay for their own connections.
+    warm_up = loop.create_task(_warm_up())
+    LOGGER.info(f"App is starting up. Creating {len(TASK_QUEUE)} background workers...")
+    workers = [loop.create_task(worker(shard)) for shard in range(len(TASK_QUEUE))]
+    if SOCKET_MODE:
+        socket_mode = loop.create_task(SOCKET_MODE.run())
+    if TASK_JOURNAL:
+        if pending := TASK_JOURNAL.open():
+            loop.create_task(_replay_journal(pending))
+    if config.USER_DIRECTORY_WARMUP and WORKSPACES.default:
+        loop.create_task(WORKSPACES.default.users.warm_up())
     yield
-    LOGGER.info("App is shutting down. Stopping background worker...")
-    TASK_QUEUE.put_nowait(None)
+    LOGGER.info("App is shutting down. Draining background workers...")
+    warm_up.cancel()
+    if SOCKET_MODE:
+        await SOCKET_MODE.close()
+        socket_mode.cancel()
+        await asyncio.gather(socket_mode, return_exceptions=True)
+    if COALESCER:
+        await COALESCER.close()
+    await TASK_QUEUE.close()
+    deadline = loop.time() + config.SHUTDOWN_DRAIN_TIMEOUT
+    await _drain("workers", workers, deadline)
+    # Workers may start streams while draining, so wait for those afterwards.
+    await _drain("reply streams", list(STREAMS.values()), deadline)
+    if TASK_JOURNAL:
+        await TASK_JOURNAL.close()
+    await asyncio.to_thread(TRACER.close)
+    if ATTACHMENTS:
+        ATTACHMENTS.close()
+    if PROFILER:
+        PROFILER.close()
+    await SLACK_SESSION.close()
+    await LANGGRAPH_CLIENT.http.client.aclose()
+    LOG_PIPELINE.close()
 
 
 APP = FastAPI(lifespan=lifespan)
@@ -180,9 +1066,65 @@ APP = FastAPI(lifespan=lifespan)
 
 @APP.post("/events/slack")
 async def slack_endpoint(req: Request):
+    if SIGNATURE_VERIFIER is None:
+        return await APP_HANDLER.handle(req)
+    event_id = await _signed_event_id(req)
+    retry_num = req.headers.get("x-slack-retry-num")
+    if EVENT_DEDUP.check_and_add(
+        "retry" if retry_num else "event_id", event_id=event_id
+    ):
+        LOGGER.info(
+            "Fast-acking duplicate event %s (retry %s, reason %s)",
+            event_id,
+            retry_num,
+            req.headers.get("x-slack-retry-reason"),
+        )
+        # Ack without processing, and ask Slack not to retry again.
+        return Response(headers={"X-Slack-No-Retry": "1"})
+    response = await APP_HANDLER.handle(req)
+    if response.status_code >= 400:
+        # Slack will retry; make sure the retry is not taken for a duplicate.
+        EVENT_DEDUP.discard(event_id=event_id)
+    return response
+
+
+@APP.get("/slack/install")
+@APP.get("/slack/oauth_redirect")
+async def slack_oauth(req: Request):
+    """Install the app into a workspace, with SLACK_CLIENT_ID set."""
     return await APP_HANDLER.handle(req)
 
 
+async def _handle_envelope(envelope: dict):
+    """Handle a Socket Mode envelope, which SOCKET_MODE has already acked."""
+    payload = envelope.get("payload") or {}
+    if envelope.get("type") == "events_api":
+        retry_num = envelope.get("retry_attempt")
+        event_id = payload.get("event_id")
+        if EVENT_DEDUP.check_and_add(
+            "retry" if retry_num else "event_id", event_id=event_id
+        ):
+            LOGGER.info("Ignoring duplicate event %s (retry %s)", event_id, retry_num)
+            return
+    await APP_HANDLER.app.async_dispatch(
+        AsyncBoltRequest(body=payload, mode="socket_mode")
+    )
+
+
+async def _signed_event_id(req: Request) -> str | None:
+    """Return the event_id of a correctly signed Events API request."""
+    if not req.headers.get("content-type", "").startswith("application/json"):
+        return None
+    body = await req.body()
+    if not SIGNATURE_VERIFIER.is_valid_request(body, dict(req.headers)):
+        # Bolt will reject it.
+        return None
+    try:
+        return json.loads(body).get("event_id")
+    except ValueError:
+        return None
+
+
 def _get_text(content: str | list[dict]):
     if isinstance(content, str):
         return content
@@ -190,33 +1132,125 @@ def _get_text(content: str | list[dict]):
         return "".join([block["text"] for block in content if block["type"] == "text"])
 
 
-def _clean_markdown(text: str) -> str:
-    text = re.sub(r"^```[^\n]*\n", "```\n", text, flags=re.MULTILINE)
-    text = re.sub(r"\[([^\]]+)\]\(([^)]+)\)", r"<\2|\1>", text)
-    text = re.sub(r"\*\*([^*]+)\*\*", r"*\1*", text)
-    text = re.sub(r"(?<!\*)\*([^*]+)\*(?!\*)", r"_\1_", text)
-    text = re.sub(r"_([^_]+)_", r"_\1_", text)
-    text = re.sub(r"^\s*[-*]\s", "• ", text, flags=re.MULTILINE)
-    return text
-
-
 @APP.post("/callbacks/{thread_id}")
 async def webhook_callback(req: Request):
-    body = await req.json()
+    try:
+        body, size = await CALLBACK_READER.read(req)
+    except PayloadTooLarge as exc:
+        LOGGER.warning(f"Refused a webhook callback too large to handle: {exc}")
+        # The run is over, so its answer is lost; let the user know to ask again.
+        if "channel" in req.query_params and "user" in req.query_params:
+            await _reply_busy(dict(req.query_params))
+        return JSONResponse({"status": "too large"}, status_code=413)
+    metrics.CALLBACK_BYTES.observe(size)
     LOGGER.info(
-        f"Received webhook callback for {req.path_params['thread_id']}/{body['thread_id']}"
+        "Received webhook callback for %s/%s",
+        req.path_params["thread_id"],
+        body["thread_id"],
+        extra={"thread_id": body["thread_id"], "callback_bytes": size},
     )
-    TASK_QUEUE.put_nowait({"type": "callback", "event": body})
+    trace = _trace_from_metadata(body.get("metadata") or {})
+    if trace:
+        TRACER.start_span(
+            "langgraph.run",
+            trace,
+            start_ns=body["metadata"].get("run_started_ns"),
+            thread_id=body["thread_id"],
+            run_id=body.get("run_id"),
+            status=body.get("status"),
+        ).end()
+    if not await _enqueue({"type": "callback", "event": body, "trace": trace}):
+        return JSONResponse({"status": "busy"}, status_code=503)
     return {"status": "success"}
 
 
-async def _is_mention(event: SlackMessageData):
-    global USER_ID_PATTERN
-    if not config.BOT_USER_ID or config.BOT_USER_ID == "fake-user-id":
-        config.BOT_USER_ID = (await APP_HANDLER.app.client.auth_test())["user_id"]
-        USER_ID_PATTERN = re.compile(rf"<@{config.BOT_USER_ID}>")
-    matches = re.search(USER_ID_PATTERN, event["text"])
-    return bool(matches)
+def _trace_from_metadata(metadata: dict) -> TraceContext | None:
+    if not metadata.get("trace_id"):
+        return None
+    return {
+        "trace_id": metadata["trace_id"],
+        "span_id": metadata["trace_span_id"],
+        "start_ns": metadata["trace_start_ns"],
+    }
+
+
+@APP.get("/queue/stats")
+async def queue_stats():
+    return TASK_QUEUE.stats()
+
+
+@APP.get("/stats")
+async def stats():
+    return {
+        "queue": TASK_QUEUE.stats(),
+        "workspaces": WORKSPACES.stats(),
+        "slack_api": SLACK_API_STATS.stats(),
+        "thread_history": (
+            THREAD_HISTORY_STATS.stats() if THREAD_HISTORY_STATS else None
+        ),
+        "users": USER_STATS.stats(),
+        "coalesced_messages": COALESCER.merged if COALESCER else None,
+        "duplicate_events": EVENT_DEDUP.stats(),
+        "callback_payloads": CALLBACK_READER.stats(),
+        "socket_mode": SOCKET_MODE.stats() if SOCKET_MODE else None,
+        "answer_cache": ANSWER_CACHE.stats() if ANSWER_CACHE else None,
+        "attachments": ATTACHMENTS.stats() if ATTACHMENTS else None,
+        "profiling": PROFILER.stats() if PROFILER else None,
+        "logging": LOG_PIPELINE.stats(),
+        "context_summaries": CONTEXT_BUILDER.stats() if CONTEXT_BUILDER else None,
+        "forwarded_cursors": FORWARDED_TS.stats() if FORWARDED_TS is not None else None,
+        "http_pools": _pool_stats(),
+    }
+
+
+async def invalidate_answers(
+    req: Request, text: str | None = None, channel: str = "", team: str | None = None
+):
+    """Forget the cached answer to `text` (asked in `channel` of `team`, for
+    the channel scope and multiple workspaces), or every cached answer if no
+    text is given."""
+    if not hmac.compare_digest(
+        req.headers.get("authorization", "").encode(),
+        f"Bearer {config.ANSWER_CACHE_ADMIN_TOKEN}".encode(),
+    ):
+        return JSONResponse({"status": "unauthorized"}, status_code=401)
+    if not ANSWER_CACHE:
+        return JSONResponse({"status": "disabled"}, status_code=404)
+    if not ANSWER_CACHE.invalidate(text, channel, team):
+        return JSONResponse({"status": "not found"}, status_code=404)
+    return {"status": "success"}
+
+
+# Served by the same app as the Slack endpoint, so only with a token.
+if config.ANSWER_CACHE_ADMIN_TOKEN:
+    APP.delete("/answers")(invalidate_answers)
+
+
+@APP.get("/metrics")
+async def prometheus_metrics():
+    return Response(generate_latest(metrics.REGISTRY), media_type=CONTENT_TYPE_LATEST)
+
+
+async def _is_mention(event: SlackMessageData, workspace: Workspace):
+    # Normally resolved by the warm-up; this covers a failed or unfinished one,
+    # and is only a check once the workspace knows its bot.
+    await workspace.resolve_bot_user_id()
+    return workspace.is_mention(event["text"])
+
+
+async def _event_workspace(event: SlackMessageData) -> Workspace | None:
+    return await WORKSPACES.get(
+        event.get("context_team_id"), event.get("context_enterprise_id")
+    )
+
+
+async def _task_workspace(task: dict) -> Workspace | None:
+    if task["type"] == "callback":
+        metadata = task["event"].get("metadata") or {}
+        return await WORKSPACES.get(
+            metadata.get("slack_team_id"), metadata.get("slack_enterprise_id")
+        )
+    return await _event_workspace(task["event"])
 
 
 def _get_thread_id(thread_ts: str, channel: str) -> str:
@@ -230,75 +1264,110 @@ def _is_dm(event: SlackMessageData):
 
 
 async def _fetch_thread_history(
-    channel_id: str, thread_ts: str
+    workspace: Workspace, channel_id: str, thread_ts: str
 ) -> list[SlackMessageData]:
     """
     Fetch all messages in a Slack thread, following pagination if needed.
+
+    Threads already in the workspace's history cache are only fetched from the
+    last bot reply (or the last fetched message) onwards and merged into it.
     """
+    history = workspace.thread_history
+    oldest = history.refresh_from(channel_id, thread_ts) if history else None
     LOGGER.info(
-        f"Fetching thread history for channel={channel_id}, thread_ts={thread_ts}"
+        "Fetching thread history for channel=%s, thread_ts=%s, oldest=%s",
+        channel_id,
+        thread_ts,
+        oldest,
+        extra={"channel": channel_id},
     )
     all_messages = []
     cursor = None
+    complete = False
 
     while True:
         try:
-            if cursor:
-                response = await APP_HANDLER.app.client.conversations_replies(
-                    channel=channel_id,
-                    ts=thread_ts,
-                    inclusive=True,
-                    limit=150,
-                    cursor=cursor,
-                )
-            else:
-                response = await APP_HANDLER.app.client.conversations_replies(
-                    channel=channel_id,
-                    ts=thread_ts,
-                    inclusive=True,
-                    limit=150,
-                )
+            response = await workspace.client.conversations_replies(
+                channel=channel_id,
+                ts=thread_ts,
+                inclusive=True,
+                limit=150,
+                include_all_metadata=True,
+                **({"oldest": oldest} if oldest else {}),
+                **({"cursor": cursor} if cursor else {}),
+            )
             all_messages.extend(response["messages"])
             if not response.get("has_more"):
+                complete = True
                 break
             cursor = response["response_metadata"]["next_cursor"]
         except Exception as exc:
+            if isinstance(exc, SlackApiError) and exc.response.status_code == 429:
+                # The rate limiter has run out of retries; the thread would be
+                # cut short, so fail the task instead.
+                raise
             LOGGER.exception(f"Error fetching thread messages: {exc}")
             break
 
+    if not history:
+        return all_messages
+    if oldest:
+        # Even a partial refresh is safe to merge; the next one starts from the
+        # same point.
+        return history.store(channel_id, thread_ts, all_messages, replace=False)
+    if complete:
+        return history.store(channel_id, thread_ts, all_messages, replace=True)
     return all_messages
 
 
-async def _fetch_user_names(user_ids: set[str]) -> dict[str, str]:
+async def _fetch_user_names(workspace: Workspace, user_ids: set[str]) -> dict[str, str]:
     """Fetch and cache Slack display names for user IDs."""
-    uncached_ids = [uid for uid in user_ids if uid not in USER_NAME_CACHE]
-    if uncached_ids:
-        tasks = [APP_HANDLER.app.client.users_info(user=uid) for uid in uncached_ids]
-        results = await asyncio.gather(*tasks, return_exceptions=True)
-        for uid, result in zip(uncached_ids, results):
-            if isinstance(result, Exception):
-                LOGGER.warning(f"Failed to fetch user info for {uid}: {result}")
-                continue
-            user_obj = result.get("user", {})
-            profile = user_obj.get("profile", {})
-            display_name = (
-                profile.get("display_name") or profile.get("real_name") or uid
-            )
-            USER_NAME_CACHE[uid] = display_name
-    return {uid: USER_NAME_CACHE[uid] for uid in user_ids if uid in USER_NAME_CACHE}
+    with metrics.timed("user_names"):
+        return await workspace.users.get_names(user_ids)
+
+
+async def _fetch_file_texts(
+    workspace: Workspace, messages: list[SlackMessageData]
+) -> dict[str, str]:
+    """Read the files attached to messages, returning their text by file ID."""
+    files = [file for msg in messages for file in msg.get("files") or []]
+    if not ATTACHMENTS or not files:
+        return {}
+    with metrics.timed("attachments"):
+        return await ATTACHMENTS.texts(workspace.client.client, files)
+
 
+async def _build_contextual_message(
+    event: SlackMessageData, workspace: Workspace
+) -> tuple[str, str]:
+    """Build a message with thread context, using display names for all users.
 
-async def _build_contextual_message(event: SlackMessageData) -> str:
-    """Build a message with thread context, using display names for all users."""
+    Returns the message and the ts of the newest Slack message it contains.
+    """
     thread_ts = event.get("thread_ts") or event["ts"]
     channel_id = event["channel"]
+    thread_id = _get_thread_id(thread_ts, channel_id)
 
-    history = await _fetch_thread_history(channel_id, thread_ts)
+    with metrics.timed("history_fetch"):
+        history = await _fetch_thread_history(workspace, channel_id, thread_ts)
     included = []
     for msg in reversed(history):
-        if msg.get("bot_id") == config.BOT_USER_ID:
+        # Later messages (and replies to them) are handled by their own tasks.
+        if float(msg["ts"]) > float(event["ts"]):
+            continue
+        if is_bot_reply(msg, workspace.bot_user_id):
             break
         included.append(msg)
+    if not included:
+        # The history could not be fetched.
+        included = [event]
+
+    # Skip messages the LangGraph thread has already been sent. Without a
+    # cursor (a new thread, or after a restart) the full context is rebuilt.
+    if FORWARDED_TS is not None and (cursor := FORWARDED_TS.get(thread_id)):
+        delta = [msg for msg in included if float(msg["ts"]) > float(cursor)]
+        # Always resend at least the newest message, e.g. for a replayed task.
+        included = delta or included[:1]
 
     all_user_ids = set()
     for msg in included:
@@ -308,10 +1377,17 @@ async def _build_contextual_message(event: SlackMessageData) -> str:
     all_user_ids.add(event["user"])
     all_user_ids.update(MENTION_REGEX.findall(event["text"]))
 
-    user_names = await _fetch_user_names(all_user_ids)
+    # Files are read while the names are looked up; both are timed separately.
+    user_names, file_texts = await asyncio.gather(
+        _fetch_user_names(workspace, all_user_ids),
+        _fetch_file_texts(workspace, included),
+    )
 
-    def format_message(msg: SlackMessageData) -> str:
+    def format_message(msg: SlackMessageData) -> ContextMessage:
         text = msg["text"]
+        for file in msg.get("files") or []:
+            if (file_text := file_texts.get(file.get("id"))) is not None:
+                text += f'\n<attachment name="{file["name"]}">{file_text}</attachment>'
         user_id = msg.get("user", "unknown")
 
         def repl(match: re.Match) -> str:
@@ -321,20 +1397,27 @@ async def _build_contextual_message(event: SlackMessageData) -> str:
         replaced_text = MENTION_REGEX.sub(repl, text)
         speaker_name = user_names.get(user_id, user_id)
 
-        return (
-            f'<slackMessage user="{speaker_name}">' f"{replaced_text}" "</slackMessage>"
-        )
+        return ContextMessage(speaker_name, replaced_text)
 
-    context_parts = [format_message(msg) for msg in reversed(included)]
-    new_message = context_parts[-1]
-    preceding_context = "\n".join(context_parts[:-1])
+    messages = [format_message(msg) for msg in reversed(included)]
+    new_message = render_message(messages[-1])
+    if CONTEXT_BUILDER:
+        with metrics.timed("context_build"):
+            context_parts = await CONTEXT_BUILDER.build(
+                thread_id,
+                messages[:-1],
+                reserved=estimate_tokens(new_message),
+            )
+    else:
+        context_parts = [render_message(msg) for msg in messages[:-1]]
+    preceding_context = "\n".join(context_parts)
 
     contextual_message = (
         (("Preceding context:\n" + preceding_context) if preceding_context else "")
         + "\n\nNew message:\n"
         + new_message
     )
-    return contextual_message
+    return contextual_message, included[0]["ts"]
 
 
 if __name__ == "__main__":
@@ -0,0 +1,128 @@
+import asyncio
+import json
+import logging
+import random
+from collections import Counter
+from typing import Awaitable, Callable
+
+import aiohttp
+from slack_sdk.web.async_client import AsyncWebClient
+
+LOGGER = logging.getLogger(__name__)
+
+
+class SocketModeRunner:
+    """Receives Slack events over a Socket Mode websocket instead of HTTP.
+
+    Every envelope is acked as soon as it arrives and then handed to `handler`
+    in a task of its own, so slow handling never makes Slack redeliver. The
+    connection is reopened when Slack asks for it (immediately) or when it
+    drops (after a jittered delay that doubles, up to max_backoff, while
+    connecting keeps failing).
+    """
+
+    def __init__(
+        self,
+        app_token: str,
+        handler: Callable[[dict], Awaitable[None]],
+        base_url: str = AsyncWebClient.BASE_URL,
+        ping_interval: float = 10,
+        min_backoff: float = 1,
+        max_backoff: float = 60,
+    ):
+        self.app_token = app_token
+        self.handler = handler
+        self.base_url = base_url
+        self.ping_interval = ping_interval
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.connected = False
+        self.connections = 0
+        self.envelopes: Counter[str] = Counter()
+        self._closed = False
+        self._session: aiohttp.ClientSession | None = None
+        self._ws: aiohttp.ClientWebSocketResponse | None = None
+        self._handling: set[asyncio.Task] = set()
+
+    async def run(self) -> None:
+        """Keep a connection open until close() is called."""
+        self._session = aiohttp.ClientSession()
+        client = AsyncWebClient(base_url=self.base_url, session=self._session)
+        failures = 0
+        try:
+            while not self._closed:
+                refresh = False
+                try:
+                    response = await client.apps_connections_open(
+                        app_token=self.app_token
+                    )
+                    async with self._session.ws_connect(
+                        response["url"], heartbeat=self.ping_interval
+                    ) as ws:
+                        self._ws = ws
+                        refresh = await self._receive(ws)
+                    failures = 0 if self.connected else failures + 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as exc:
+                    failures += 1
+                    LOGGER.warning(f"Socket Mode connection failed: {exc!r}")
+                finally:
+                    self._ws = None
+                    self.connected = False
+                if self._closed or refresh:
+                    continue
+                delay = min(
+                    self.max_backoff, self.min_backoff * 2 ** max(failures - 1, 0)
+                )
+                delay *= random.uniform(0.5, 1)
+                LOGGER.info(f"Reconnecting to Socket Mode in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        finally:
+            await self._session.close()
+
+    async def _receive(self, ws: aiohttp.ClientWebSocketResponse) -> bool:
+        """Read envelopes until the connection ends.
+
+        Returns True if Slack asked for a new connection.
+        """
+        async for message in ws:
+            if message.type != aiohttp.WSMsgType.TEXT:
+                break
+            envelope = json.loads(message.data)
+            kind = envelope.get("type")
+            self.envelopes[kind] += 1
+            if kind == "hello":
+                self.connected = True
+                self.connections += 1
+                LOGGER.info("Connected to Slack in Socket Mode")
+            elif kind == "disconnect":
+                LOGGER.info(f"Slack closed the Socket Mode connection: {envelope}")
+                return True
+            elif envelope_id := envelope.get("envelope_id"):
+                await ws.send_str(json.dumps({"envelope_id": envelope_id}))
+                task = asyncio.create_task(self._handle(envelope))
+                self._handling.add(task)
+                task.add_done_callback(self._handling.discard)
+        return False
+
+    async def _handle(self, envelope: dict) -> None:
+        try:
+            await self.handler(envelope)
+        except Exception as exc:
+            LOGGER.exception(f"Error handling {envelope.get('type')} envelope: {exc}")
+
+    async def close(self) -> None:
+        """Stop receiving and wait for envelopes being handled."""
+        self._closed = True
+        if self._ws is not None:
+            await self._ws.close()
+        if self._handling:
+            await asyncio.gather(*self._handling, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "connected": self.connected,
+            "connections": self.connections,
+            "envelopes": dict(self.envelopes),
+        }
@@ -0,0 +1,160 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator, TypedDict
+
+LOGGER = logging.getLogger(__name__)
+
+
+class TraceContext(TypedDict):
+    """What is carried between hops: in tasks, run metadata and callbacks."""
+
+    trace_id: str
+    span_id: str
+    start_ns: int
+
+
+class Span:
+    def __init__(
+        self,
+        tracer: "Tracer",
+        name: str,
+        trace_id: str,
+        parent_id: str | None,
+        start_ns: int,
+        attributes: dict,
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.start_ns = start_ns
+        self.attributes = attributes
+        self.error: str | None = None
+
+    def end(self, end_ns: int | None = None) -> None:
+        self.tracer._export(self, end_ns or time.time_ns())
+
+    def to_dict(self, end_ns: int) -> dict:
+        # Field names follow the OTLP JSON encoding of a span.
+        record = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.parent_id or "",
+            "name": self.name,
+            "startTimeUnixNano": self.start_ns,
+            "endTimeUnixNano": end_ns,
+            "attributes": self.attributes,
+        }
+        if self.error:
+            record["status"] = {"code": "STATUS_CODE_ERROR", "message": self.error}
+        return record
+
+
+class Tracer:
+    """Creates spans and hands finished ones to a JSONL writer thread.
+
+    Without a path, spans are still created (so trace IDs show up in run
+    metadata and logs) but not written anywhere.
+    """
+
+    def __init__(self, path: str | None = None):
+        self.path = path
+        self._spans: queue.SimpleQueue[dict | None] = queue.SimpleQueue()
+        self._writer: threading.Thread | None = None
+        if path:
+            self._writer = threading.Thread(
+                target=self._write, name="span-writer", daemon=True
+            )
+            self._writer.start()
+
+    def new_trace(self, start_ns: int | None = None) -> TraceContext:
+        """Start a trace whose root span is ended later, maybe in another hop."""
+        return {
+            "trace_id": os.urandom(16).hex(),
+            "span_id": os.urandom(8).hex(),
+            "start_ns": start_ns or time.time_ns(),
+        }
+
+    def start_span(
+        self,
+        name: str,
+        context: TraceContext,
+        start_ns: int | None = None,
+        **attributes,
+    ) -> Span:
+        """Start a child of the trace's root span."""
+        return Span(
+            self,
+            name,
+            context["trace_id"],
+            context["span_id"],
+            start_ns or time.time_ns(),
+            attributes,
+        )
+
+    @contextmanager
+    def span(
+        self, name: str, context: TraceContext | None, **attributes
+    ) -> Iterator[Span | None]:
+        """Record the block as a span, marking it failed if it raises."""
+        if context is None:
+            yield None
+            return
+        span = self.start_span(name, context, **attributes)
+        try:
+            yield span
+        except BaseException as exc:
+            span.error = repr(exc)
+            raise
+        finally:
+            span.end()
+
+    def end_trace(self, name: str, context: TraceContext, **attributes) -> None:
+        """End a trace's root span, which started at context["start_ns"]."""
+        span = Span(
+            self, name, context["trace_id"], None, context["start_ns"], attributes
+        )
+        span.span_id = context["span_id"]
+        span.end()
+
+    def _export(self, span: Span, end_ns: int) -> None:
+        if self._writer:
+            self._spans.put(span.to_dict(end_ns))
+
+    def _write(self) -> None:
+        # Each batch is one O_APPEND write, so several processes can share a
+        # file without interleaving their lines.
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            closed = False
+            while not closed:
+                lines = []
+                record = self._spans.get()
+                while True:
+                    if record is None:
+                        closed = True
+                        break
+                    lines.append(json.dumps(record) + "\n")
+                    if self._spans.empty():
+                        break
+                    record = self._spans.get()
+                if lines:
+                    try:
+                        os.write(fd, "".join(lines).encode())
+                    except OSError as exc:
+                        LOGGER.warning(f"Failed to write {len(lines)} spans: {exc}")
+        finally:
+            os.close(fd)
+
+    def close(self) -> None:
+        """Write out the remaining spans."""
+        if self._writer:
+            self._spans.put(None)
+            self._writer.join()
+            self._writer = None
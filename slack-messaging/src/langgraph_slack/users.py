@@ -0,0 +1,91 @@
+import asyncio
+import logging
+
+from slack_sdk.web.async_client import AsyncWebClient
+
+from langgraph_slack.backend import LOCAL, Backend
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _display_name(user: dict) -> str:
+    profile = user.get("profile", {})
+    return profile.get("display_name") or profile.get("real_name") or user["id"]
+
+
+class UserDirectory:
+    """Slack display names by user ID.
+
+    Names are kept in a size-bounded LRU cache and expire after ttl seconds.
+    Concurrent lookups of the same uncached ID share a single users.info call.
+    """
+
+    def __init__(
+        self,
+        client: AsyncWebClient,
+        maxsize: int,
+        ttl: float | None,
+        backend: Backend = LOCAL,
+    ):
+        self.client = client
+        self._names = backend.cache("users", maxsize, ttl)
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    async def get_names(self, user_ids: set[str]) -> dict[str, str]:
+        """Return display names for the IDs that could be resolved."""
+        names = {}
+        lookups = {}
+        for uid in user_ids:
+            if (name := self._names.get(uid)) is not None:
+                names[uid] = name
+            else:
+                lookups[uid] = self._lookup(uid)
+        if lookups:
+            results = await asyncio.gather(*lookups.values())
+            for uid, name in zip(lookups, results):
+                if name is not None:
+                    names[uid] = name
+        return names
+
+    def _lookup(self, uid: str) -> asyncio.Task:
+        if (task := self._inflight.get(uid)) is None:
+            task = asyncio.ensure_future(self._fetch(uid))
+            self._inflight[uid] = task
+            task.add_done_callback(lambda _: self._inflight.pop(uid, None))
+        return task
+
+    async def _fetch(self, uid: str) -> str | None:
+        try:
+            result = await self.client.users_info(user=uid)
+        except Exception as exc:
+            LOGGER.warning(f"Failed to fetch user info for {uid}: {exc}")
+            return None
+        name = _display_name(result.get("user") or {"id": uid})
+        self._names.set(uid, name)
+        return name
+
+    async def warm_up(self, page_size: int = 200) -> None:
+        """Load every workspace member's name with paginated users.list calls."""
+        cursor = None
+        loaded = 0
+        while True:
+            try:
+                response = await self.client.users_list(
+                    limit=page_size, **({"cursor": cursor} if cursor else {})
+                )
+            except Exception as exc:
+                LOGGER.warning(f"User directory warm-up stopped early: {exc}")
+                break
+            for user in response.get("members", []):
+                self._names.set(user["id"], _display_name(user))
+                loaded += 1
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                break
+        LOGGER.info(
+            f"User directory warm-up loaded {loaded} users "
+            f"({len(self._names)} cached, max {self._names.maxsize})"
+        )
+
+    def stats(self) -> dict:
+        return {**self._names.stats(), "inflight": len(self._inflight)}
@@ -0,0 +1,192 @@
+import asyncio
+import logging
+import re
+import time
+from collections import Counter
+from typing import Callable, Iterable, Iterator, Protocol
+
+from slack_sdk.oauth.installation_store.async_installation_store import (
+    AsyncInstallationStore,
+)
+
+from langgraph_slack.cache import LRUCache
+from langgraph_slack.history import ThreadHistoryCache
+from langgraph_slack.ratelimit import RateLimitedClient
+from langgraph_slack.users import UserDirectory
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Workspace:
+    """A Slack workspace the bridge is installed in.
+
+    Each workspace has its own Slack client, and so its own share of Slack's
+    rate limits (which are per workspace), and its own user and thread caches.
+    """
+
+    def __init__(
+        self,
+        team_id: str | None,
+        bot_user_id: str | None,
+        client: RateLimitedClient,
+        users: UserDirectory,
+        thread_history: ThreadHistoryCache | None,
+        expires_at: float | None = None,
+    ):
+        self.team_id = team_id
+        self.client = client
+        self.users = users
+        self.thread_history = thread_history
+        # Unix time the bot token expires, with token rotation.
+        self.expires_at = expires_at
+        self._resolving: asyncio.Future | None = None
+        self.set_bot_user_id(bot_user_id)
+
+    def set_bot_user_id(self, bot_user_id: str | None) -> None:
+        self.bot_user_id = bot_user_id
+        self.mention = re.compile(rf"<@{bot_user_id}>")
+        if self.thread_history:
+            self.thread_history.bot_user_id = bot_user_id
+
+    async def resolve_bot_user_id(self) -> str:
+        """Return the bot's user ID, asking auth.test the first time if the
+        token came without it. Concurrent callers share one call."""
+        if self.bot_user_id and self.bot_user_id != "fake-user-id":
+            return self.bot_user_id
+        if self._resolving is None:
+            self._resolving = asyncio.ensure_future(self.client.auth_test())
+        try:
+            response = await asyncio.shield(self._resolving)
+        except Exception:
+            # Let the next caller try again.
+            self._resolving = None
+            raise
+        self.set_bot_user_id(response["user_id"])
+        return self.bot_user_id
+
+    def is_mention(self, text: str) -> bool:
+        return self.mention.search(text) is not None
+
+
+class WorkspaceRegistry:
+    """The workspaces the bridge serves, by team ID.
+
+    With a single bot token there is only the `default` workspace. With an
+    installation store, a workspace is created from its installation when its
+    first event arrives, and only the maxsize most recently active workspaces
+    are kept, so their clients and caches stay bounded however many teams
+    install the app. Concurrent lookups of the same team share one load.
+    """
+
+    def __init__(
+        self,
+        create: Callable[[str | None, str, str | None, float | None], Workspace],
+        default: Workspace | None = None,
+        installation_store: AsyncInstallationStore | None = None,
+        maxsize: int = 100,
+    ):
+        if default is None and installation_store is None:
+            raise ValueError("Either a default workspace or a store is required")
+        self.create = create
+        self.default = default
+        self.installation_store = installation_store
+        self.created = 0
+        self._active: LRUCache[str, Workspace] = LRUCache(maxsize)
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def __iter__(self) -> Iterator[Workspace]:
+        if self.default is not None:
+            return iter([self.default])
+        return iter(self._active.values())
+
+    async def get(
+        self, team_id: str | None, enterprise_id: str | None = None
+    ) -> Workspace | None:
+        """Return the team's workspace, or None if the app is not installed."""
+        if self.default is not None:
+            return self.default
+        key = team_id or enterprise_id
+        if key is None:
+            return None
+        workspace = self._active.get(key)
+        if workspace is not None and (
+            workspace.expires_at is None or workspace.expires_at > time.time()
+        ):
+            return workspace
+        if (task := self._inflight.get(key)) is None:
+            task = asyncio.ensure_future(self._load(key, team_id, enterprise_id))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await task
+
+    async def _load(
+        self, key: str, team_id: str | None, enterprise_id: str | None
+    ) -> Workspace | None:
+        bot = await self.installation_store.async_find_bot(
+            enterprise_id=enterprise_id,
+            team_id=team_id,
+            is_enterprise_install=team_id is None,
+        )
+        if bot is None or not bot.bot_token:
+            LOGGER.warning(f"No installation found for team {key}")
+            return None
+        expires_at = (
+            bot.bot_token_expires_at.timestamp() if bot.bot_token_expires_at else None
+        )
+        if (workspace := self._active.get(key, count=False)) is not None:
+            # The token was rotated (by Bolt, when authorizing an event); keep
+            # the client's rate-limit state and the caches.
+            workspace.client.client.token = bot.bot_token
+            workspace.expires_at = expires_at
+            return workspace
+        workspace = self.create(team_id, bot.bot_token, bot.bot_user_id, expires_at)
+        self._active.set(key, workspace)
+        self.created += 1
+        LOGGER.info(f"Serving team {key} ({len(self._active)} active)")
+        return workspace
+
+    def evict(self, team_id: str | None, enterprise_id: str | None = None) -> None:
+        """Forget a team's workspace, e.g. once the app is uninstalled."""
+        if (key := team_id or enterprise_id) is not None:
+            self._active.pop(key)
+
+    def stats(self) -> dict:
+        if self.default is not None:
+            return {"multi_workspace": False}
+        return {
+            "multi_workspace": True,
+            **self._active.stats(),
+            "created": self.created,
+            "teams": [workspace.team_id for workspace in self],
+        }
+
+
+class _Stats(Protocol):
+    def stats(self) -> dict: ...
+
+
+class CombinedStats:
+    """The stats() of one component of every active workspace, added up.
+
+    Numbers are summed, and so are dicts of numbers, key by key. `empty` is
+    the result while there are no workspaces.
+    """
+
+    def __init__(self, parts: Callable[[], Iterable[_Stats | None]], empty: dict):
+        self.parts = parts
+        self.empty = empty
+
+    def stats(self) -> dict:
+        total = dict(self.empty)
+        for part in self.parts():
+            if part is None:
+                continue
+            for key, value in part.stats().items():
+                if isinstance(value, dict):
+                    total[key] = dict(Counter(total.get(key, {})) + Counter(value))
+                elif isinstance(value, (int, float)) and key != "hit_ratio":
+                    total[key] = total.get(key, 0) + value
+        if "hits" in total:
+            lookups = total["hits"] + total["misses"]
+            total["hit_ratio"] = round(total["hits"] / lookups, 3) if lookups else None
+        return total